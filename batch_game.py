@@ -0,0 +1,234 @@
+import numpy as np
+import bitboard
+
+#
+# Vectorized batch of games
+#
+# N boards are kept in one (N, 4, 4) uint8 array of tile exponents (0 for an
+# empty cell, 1 for a 2, 2 for a 4, ...). A move vector is applied to every
+# board at once: each board is turned so its move reads along rows, rows are
+# encoded as 16-bit codes and slid/merged through the bitboard row tables.
+#
+
+ROW_TABLES = np.array([bitboard.ROW_LEFT, bitboard.ROW_RIGHT], dtype=np.uint16)
+ROW_SCORE = np.array(bitboard.ROW_SCORE, dtype=np.int64)
+NIBBLE_SHIFTS = np.array([0, 4, 8, 12], dtype=np.uint16)
+
+
+def encode_rows(lines):
+    lines = lines.astype(np.uint16)
+    return lines[..., 0] | (lines[..., 1] << 4) | (lines[..., 2] << 8) | (lines[..., 3] << 12)
+
+
+def decode_rows(codes):
+    return ((codes[..., None] >> NIBBLE_SHIFTS) & 0xF).astype(np.uint8)
+
+
+def slide(boards, moves):
+    # returns the moved boards, whether each board changed and the merge bonus, like logic.up and friends
+    vertical = (moves == 0) | (moves == 1)
+    backwards = (moves == 1) | (moves == 3)
+    lines = np.where(vertical[:, None, None], boards.transpose(0, 2, 1), boards)
+    codes = encode_rows(lines)
+    result = decode_rows(ROW_TABLES[backwards.astype(np.intp)[:, None], codes])
+    result = np.where(vertical[:, None, None], result.transpose(0, 2, 1), result)
+    bonus = ROW_SCORE[codes].sum(axis=1)
+    changed = (result != boards).any(axis=(1, 2))
+    return result, changed, bonus
+
+
+def game_over(boards):
+    has_empty = (boards == 0).any(axis=(1, 2))
+    has_merge = (boards[:, :, 1:] == boards[:, :, :-1]).any(axis=(1, 2)) | \
+                (boards[:, 1:, :] == boards[:, :-1, :]).any(axis=(1, 2))
+    return ~(has_empty | has_merge)
+
+
+def spawn(boards, games, rng):
+    # puts a 2 on a uniformly chosen empty cell of every selected board, like logic.add_two
+    cells = boards.reshape(len(boards), 16)
+    empty = cells == 0
+    games = games & empty.any(axis=1)
+    if not games.any():
+        return
+    empty = empty[games]
+    choice = (rng.random(len(empty)) * empty.sum(axis=1)).astype(np.int64)
+    position = np.argmax(np.cumsum(empty, axis=1) > choice[:, None], axis=1)
+    cells[np.flatnonzero(games), position] = 1
+
+
+# ------------------------------- Packed boards -------------------------------
+# bitboard.afterstates over a uint64 array of packed 4x4 boards
+
+PACKED_ROW_LEFT = np.array(bitboard.ROW_LEFT, dtype=np.uint64)
+PACKED_ROW_RIGHT = np.array(bitboard.ROW_RIGHT, dtype=np.uint64)
+ROW_SHIFTS = np.array([0, 16, 32, 48], dtype=np.uint64)
+
+
+def afterstates(boards):
+    # (N, 4) afterstates, (N, 4) merge bonuses and (N, 4) legality, columns in move order
+    boards = np.asarray(boards, dtype=np.uint64)
+    rows = ((boards[:, None] >> ROW_SHIFTS) & np.uint64(bitboard.ROW_MASK)).astype(np.intp)
+    columns = ((bitboard.transpose(boards)[:, None] >> ROW_SHIFTS) & np.uint64(bitboard.ROW_MASK)).astype(np.intp)
+    after = np.empty((len(boards), 4), dtype=np.uint64)
+    after[:, 0] = bitboard.transpose(np.bitwise_or.reduce(PACKED_ROW_LEFT[columns] << ROW_SHIFTS, axis=1))
+    after[:, 1] = bitboard.transpose(np.bitwise_or.reduce(PACKED_ROW_RIGHT[columns] << ROW_SHIFTS, axis=1))
+    after[:, 2] = np.bitwise_or.reduce(PACKED_ROW_LEFT[rows] << ROW_SHIFTS, axis=1)
+    after[:, 3] = np.bitwise_or.reduce(PACKED_ROW_RIGHT[rows] << ROW_SHIFTS, axis=1)
+    column_bonus = ROW_SCORE[columns].sum(axis=1)
+    row_bonus = ROW_SCORE[rows].sum(axis=1)
+    bonus = np.stack([column_bonus, column_bonus, row_bonus, row_bonus], axis=1)
+    return after, bonus, after != boards[:, None]
+
+
+def to_exponents(matrices):
+    values = np.asarray(matrices, dtype=np.int64)
+    exponents = np.zeros(values.shape, dtype=np.uint8)
+    nonzero = values > 0
+    exponents[nonzero] = np.log2(values[nonzero]).astype(np.uint8)
+    return exponents
+
+
+def to_matrices(boards):
+    return np.where(boards > 0, np.left_shift(1, boards.astype(np.int64)), 0).tolist()
+
+
+class BatchGame:
+
+    def __init__(self, n=None, seed=None, auto_reset=True, boards=None):
+        self.rng = np.random.default_rng(seed)
+        self.auto_reset = auto_reset
+        if boards is not None:
+            self.boards = np.array(boards, dtype=np.uint8)
+        else:
+            self.boards = np.zeros((n, 4, 4), dtype=np.uint8)
+            self.spawn(np.ones(n, dtype=bool))
+            self.spawn(np.ones(n, dtype=bool))
+        n = len(self.boards)
+        self.score = np.zeros(n, dtype=np.int64)
+        self.true_score = np.zeros(n, dtype=np.int64)
+        self.invalid_moves = np.zeros(n, dtype=np.int64)
+        self.total_moves = np.zeros(n, dtype=np.int64)
+        self.over = game_over(self.boards)
+        self.finished = []  # (true_score, largest_number, total_moves, invalid_moves) of every completed game
+
+    def __len__(self):
+        return len(self.boards)
+
+    def spawn(self, games):
+        spawn(self.boards, games, self.rng)
+
+    def move(self, moves):
+        # returns per-game bonus (-1 for an invalid move, as Game.move), validity and game-over masks
+        moves = np.asarray(moves)
+        in_range = (moves >= 0) & (moves <= 3)
+        playing = ~self.over
+        counted = playing & in_range
+        result, valid, bonus = slide(self.boards, np.where(in_range, moves, 0))
+        valid &= counted
+        bonus = np.where(valid, bonus, -1)
+        bonus[~playing] = 0
+        self.boards[valid] = result[valid]
+        self.spawn(valid)
+        self.total_moves += counted
+        self.invalid_moves += counted & ~valid
+        self.score += np.where(counted, bonus, 0)
+        self.true_score += np.where(valid, bonus, 0)
+        finished = np.zeros(len(self.boards), dtype=bool)
+        finished[valid] = game_over(self.boards[valid])
+        self.over |= finished
+        if self.auto_reset and finished.any():
+            self.reset(finished)
+        return bonus, valid, finished
+
+    def largest_number(self):
+        return np.left_shift(1, self.boards.max(axis=(1, 2)).astype(np.int64))
+
+    def reset(self, games):
+        largest = self.largest_number()
+        for i in np.flatnonzero(games):
+            self.finished.append((int(self.true_score[i]), int(largest[i]), int(self.total_moves[i]), int(self.invalid_moves[i])))
+        self.boards[games] = 0
+        self.spawn(games)
+        self.spawn(games)
+        self.score[games] = 0
+        self.true_score[games] = 0
+        self.invalid_moves[games] = 0
+        self.total_moves[games] = 0
+        self.over[games] = game_over(self.boards[games])
+
+    def matrices(self):
+        return to_matrices(self.boards)
+
+
+# ------------------------------- Batch Playing Algorithms -------------------------------
+class BatchUniformRandomAlgorithm:
+    def __init__(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+
+    def __call__(self, batch, *args, **kwargs):
+        return self.rng.integers(0, 4, len(batch))
+
+
+class BatchDownLeftRightUpAlgorithm:
+    # next_decision of DownLeftRightUpAlgorithm, indexed by last_decision + 1
+    NEXT_DECISION = np.array([1, -1, 2, 3, 0])
+
+    def __init__(self):
+        self.last_state = None
+        self.last_decision = None
+
+    def __call__(self, batch, *args, **kwargs):
+        current_state = batch.boards.copy()
+        if self.last_state is None:
+            self.last_decision = np.full(len(batch), 1)
+        else:
+            unchanged = (current_state == self.last_state).all(axis=(1, 2))
+            self.last_decision = np.where(unchanged, self.NEXT_DECISION[self.last_decision + 1], 1)
+        self.last_state = current_state
+        return self.last_decision
+
+
+def rollout_scores(boards, max_moves=None, seed=None):
+    # spawns the tile due after the move that produced each board, then plays uniformly random moves on
+    # all of them until every game is over or has made max_moves valid moves; returns the scores collected.
+    # Unlike BatchGame.move only the games still playing are touched on every step.
+    rng = np.random.default_rng(seed)
+    boards = np.array(boards, dtype=np.uint8)
+    spawn(boards, np.ones(len(boards), dtype=bool), rng)
+    scores = np.zeros(len(boards), dtype=np.int64)
+    valid_moves = np.zeros(len(boards), dtype=np.int64)
+    playing = np.flatnonzero(~game_over(boards))
+    while len(playing) > 0:
+        current = boards[playing]
+        result, valid, bonus = slide(current, rng.integers(0, 4, len(playing)))
+        current[valid] = result[valid]
+        spawn(current, valid, rng)
+        boards[playing] = current
+        scores[playing] += np.where(valid, bonus, 0)
+        valid_moves[playing] += valid
+        over = np.zeros(len(playing), dtype=bool)
+        over[valid] = game_over(current[valid])
+        playing = playing[~over]
+        if max_moves is not None:
+            playing = playing[valid_moves[playing] < max_moves]
+    return scores
+
+
+def play(batch, algorithm, games):
+    # plays until `games` games have finished and returns their results
+    while len(batch.finished) < games:
+        batch.move(algorithm(batch))
+    return batch.finished[:games]
+
+
+if __name__ == "__main__":
+    import time
+    for algorithm in [BatchUniformRandomAlgorithm(seed=0), BatchDownLeftRightUpAlgorithm()]:
+        batch = BatchGame(1000, seed=0)
+        start_time = time.time()
+        results = play(batch, algorithm, 2000)
+        play_time = time.time() - start_time
+        print("{}: {} games in {:.2f}s ({:.0f} games/sec), mean score {:.1f}".format(
+            type(algorithm).__name__, len(results), play_time, len(results) / play_time,
+            np.mean([r[0] for r in results])))
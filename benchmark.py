@@ -0,0 +1,504 @@
+from machine_player import *
+from heuristic import BonusEvaluator, HeuristicEvaluator
+from search_state import SearchState
+import argparse
+import functools
+import json
+import logic
+import os
+import platform
+import subprocess
+import sys
+
+
+# ------------------------------- Board corpus -------------------------------
+def board_corpus(count, seed=0, min_tiles=0, max_tiles=16):
+    # boards sampled from seeded DownLeftRightUp games, keeping those with a tile count in range
+    rng = random.Random(seed)
+    boards = []
+    while len(boards) < count:
+        game = Game(seed=rng.getrandbits(64))
+        algorithm = DownLeftRightUpAlgorithm()
+        while not game.is_over() and len(boards) < count:
+            tiles = np.count_nonzero(game.matrix)
+            if min_tiles <= tiles <= max_tiles and rng.random() < 0.2:
+                boards.append([row[:] for row in game.matrix])
+            game.move(algorithm(game.matrix))
+    return boards
+
+
+# ------------------------------- Parallel root search -------------------------------
+def benchmark_parallel(boards=8, max_workers=None, seed=0):
+    corpus = board_corpus(boards, seed, max_tiles=8)
+    max_workers = max_workers or os.cpu_count()
+    worker_counts = [0] + [w for w in [2, 4, 8, 16, 32, 64] if w <= max_workers]
+    if max_workers not in worker_counts and max_workers > 1:
+        worker_counts.append(max_workers)
+    results = []
+    serial_moves = None
+    for workers in worker_counts:
+        algorithm = AStartAlgorithm(workers=workers, seed=seed)
+        if workers > 1:
+            algorithm(corpus[0])  # warm the pool up
+            algorithm.call_count = 0
+        start_time = time.time()
+        moves = [algorithm(matrix) for matrix in corpus]
+        elapsed = time.time() - start_time
+        if serial_moves is None:
+            serial_moves = moves
+        results.append({
+            "workers": max(workers, 1),
+            "seconds_per_move": elapsed / len(corpus),
+            "speedup": results[0]["seconds_per_move"] / (elapsed / len(corpus)) if results else 1.0,
+            "matches_serial": moves == serial_moves,
+        })
+        print("workers {workers:>3}: {seconds_per_move:.3f}s/move speedup {speedup:.2f}x "
+              "matches serial: {matches_serial}".format(**results[-1]))
+    return results
+
+
+# ------------------------------- Symmetry-canonical caching -------------------------------
+def benchmark_symmetry(boards=30, depth=3, seed=0):
+    corpus = board_corpus(boards, seed)
+    results = []
+    for canonical in [False, True]:
+        algorithm = ExpectimaxAlgorithm(depth=depth, probability_cutoff=0.0, canonical=canonical)
+        start_time = time.time()
+        for matrix in corpus:
+            algorithm(matrix)
+        elapsed = time.time() - start_time
+        nodes, hits, lookups = [sum(s[i] for s in algorithm.stats) for i in range(3)]
+        results.append({
+            "canonical": canonical,
+            "seconds_per_move": elapsed / len(corpus),
+            "nodes_per_move": nodes / len(corpus),
+            "cache_hit_rate": hits / max(lookups, 1),
+            "cache_entries": len(algorithm.cache),
+        })
+        print("canonical {canonical!s:>5}: {seconds_per_move:.4f}s/move {nodes_per_move:.0f} nodes/move "
+              "cache hit rate {cache_hit_rate:.3f} cache entries {cache_entries}".format(**results[-1]))
+    return results
+
+
+# ------------------------------- Leaf evaluation -------------------------------
+def play_seeded_game(algorithm, seed, max_moves=None):
+    # the game spawns from its own seeded rng, the global seed is for algorithms drawing from random
+    state = random.getstate()
+    random.seed(seed)
+    try:
+        game = Game(seed=seed)
+        while not game.is_over() and (max_moves is None or game.total_moves < max_moves):
+            game.move(algorithm(game.matrix))
+    finally:
+        random.setstate(state)
+    return game
+
+
+def benchmark_heuristic(games=3, time_budget=0.01, seed=0, max_moves=None):
+    # AStartAlgorithm gets the same time budget per move with each leaf evaluator; ExpectimaxAlgorithm
+    # searches a fixed depth, so compare its seconds/move alongside the scores
+    players = [
+        ("AStartAlgorithm", lambda evaluator: AStartAlgorithm(time_budget=time_budget, evaluator=evaluator)),
+        ("ExpectimaxAlgorithm", lambda evaluator: ExpectimaxAlgorithm(depth=2, evaluator=evaluator)),
+    ]
+    results = []
+    for name, create_player in players:
+        for evaluator in [BonusEvaluator(), HeuristicEvaluator()]:
+            scores = []
+            largest = []
+            depths = []
+            start_time = time.time()
+            moves = 0
+            for i in range(games):
+                algorithm = create_player(evaluator)
+                game = play_seeded_game(algorithm, seed + i, max_moves)
+                scores.append(game.true_score)
+                largest.append(game.largest_number())
+                if isinstance(algorithm, ExpectimaxAlgorithm):
+                    depths.append(algorithm.depth)
+                else:
+                    depths.extend(algorithm.reached_depths)
+                moves += game.total_moves
+            results.append({
+                "algorithm": name,
+                "evaluator": type(evaluator).__name__,
+                "mean_score": float(np.mean(scores)),
+                "mean_largest_number": float(np.mean(largest)),
+                "mean_depth": float(np.mean(depths)),
+                "seconds_per_move": (time.time() - start_time) / max(moves, 1),
+            })
+            print("{algorithm:>19} {evaluator:>18}: mean score {mean_score:.0f} mean largest tile "
+                  "{mean_largest_number:.0f} mean depth {mean_depth:.2f} {seconds_per_move:.4f}s/move".format(**results[-1]))
+    return results
+
+
+# ------------------------------- Node expansion -------------------------------
+def expand_with_clones(matrix, depth, rng):
+    nodes = 1
+    if depth == 0:
+        return nodes
+    for move in range(4):
+        g = Game(matrix, rng=rng).clone()
+        if g.move(move) != -1 and not g.is_over():
+            nodes += expand_with_clones(g.matrix, depth - 1, rng)
+    return nodes
+
+
+def expand_with_undo(state, depth):
+    nodes = 1
+    if depth == 0:
+        return nodes
+    for move in range(4):
+        if state.apply(move) != -1 and not state.is_over():
+            nodes += expand_with_undo(state, depth - 1)
+        state.undo()
+    return nodes
+
+
+def benchmark_nodes(boards=20, depth=3, seed=0):
+    # exhaustive fixed-depth expansion through Game.clone() vs one SearchState with apply/undo
+    corpus = board_corpus(boards, seed)
+    results = []
+    rng = random.Random(seed)
+    for name, expand in [("Game.clone", lambda matrix: expand_with_clones(matrix, depth, rng)),
+                         ("SearchState", lambda matrix: expand_with_undo(SearchState.from_matrix(matrix, rng), depth))]:
+        rng.seed(seed)
+        start_time = time.time()
+        nodes = sum(expand(matrix) for matrix in corpus)
+        elapsed = time.time() - start_time
+        results.append({"path": name, "nodes": nodes, "nodes_per_sec": nodes / elapsed})
+        print("{path:>12}: {nodes} nodes, {nodes_per_sec:.0f} nodes/sec".format(**results[-1]))
+    return results
+
+
+# ------------------------------- Board sizes -------------------------------
+def benchmark_sizes(boards=200, sizes=((3, 3), (4, 4), (5, 5), (6, 6)), seed=0):
+    # moves/sec of the list-of-lists logic vs the packed bitboard kernel of every board size
+    rng = random.Random(seed)
+    results = []
+    for rows, cols in sizes:
+        kernel = bitboard.kernel(rows, cols)
+        corpus = [bitboard.random_matrix(rng, 10, 0.6, rows, cols) for _ in range(boards)]
+        packed = [kernel.pack(matrix) for matrix in corpus]
+        for board in packed:
+            for move in kernel.moves:
+                move(board)  # fill the lazy row tables of rows longer than 4 first
+        start_time = time.time()
+        for matrix in corpus:
+            for move in [logic.up, logic.down, logic.left, logic.right]:
+                move(matrix)
+        logic_elapsed = time.time() - start_time
+        start_time = time.time()
+        for board in packed:
+            for move in kernel.moves:
+                move(board)
+        kernel_elapsed = time.time() - start_time
+        results.append({
+            "size": "{}x{}".format(rows, cols),
+            "logic_moves_per_sec": 4 * boards / logic_elapsed,
+            "kernel_moves_per_sec": 4 * boards / kernel_elapsed,
+        })
+        print("{size:>4}: logic {logic_moves_per_sec:.0f} moves/sec, "
+              "kernel {kernel_moves_per_sec:.0f} moves/sec".format(**results[-1]))
+    return results
+
+
+# ------------------------------- Rendering -------------------------------
+def benchmark_render(moves=500, seed=0):
+    # moves/sec shown by GameGrid when every cell is reconfigured vs only the changed ones, each frame
+    # drawn with update_idletasks. Tk needs a display, run headless under Xvfb: xvfb-run python benchmark.py render
+    game = Game(seed=seed)
+    algorithm = DownLeftRightUpAlgorithm()
+    frames = []
+    while not game.is_over() and len(frames) < moves:
+        if game.move(algorithm(game.matrix)) != -1:
+            frames.append([row[:] for row in game.matrix])
+    from tkinter import TclError
+    from puzzle import GameGrid
+    try:
+        grid = GameGrid(start=False)
+    except TclError as error:
+        print("Tk can't open a display ({}), run under xvfb-run".format(error))
+        return []
+    results = []
+    for name, dirty_cells in [("all cells", False), ("changed cells", True)]:
+        start_time = time.perf_counter()
+        for matrix in frames:
+            if not dirty_cells:
+                grid.rendered = None
+            grid.update_grid_cells(matrix)
+            grid.update_idletasks()
+        results.append({"redraw": name, "moves_per_sec": len(frames) / (time.perf_counter() - start_time)})
+        print("{redraw:>13}: {moves_per_sec:.0f} moves/sec".format(**results[-1]))
+    grid.master.destroy()
+    return results
+
+
+# ------------------------------- Monte Carlo rollouts -------------------------------
+def benchmark_montecarlo(games=2, rollouts=50, max_moves=None, workers=0, use_processes=False, seed=0):
+    # MonteCarloAlgorithm against fixed-depth AStartAlgorithm on the same seeded games
+    players = [
+        ("MonteCarloAlgorithm", lambda: MonteCarloAlgorithm(rollouts, max_moves, workers, use_processes, seed)),
+        ("AStartAlgorithm", lambda: AStartAlgorithm(seed=seed)),
+    ]
+    results = []
+    for name, create_player in players:
+        scores = []
+        moves = 0
+        playouts_per_second = []
+        start_time = time.time()
+        for i in range(games):
+            algorithm = create_player()
+            game = play_seeded_game(algorithm, seed + i)
+            scores.append(game.true_score)
+            moves += game.total_moves
+            if isinstance(algorithm, MonteCarloAlgorithm):
+                playouts_per_second.append(algorithm.playouts_per_second())
+        results.append({
+            "algorithm": name,
+            "mean_score": float(np.mean(scores)),
+            "seconds_per_move": (time.time() - start_time) / max(moves, 1),
+            "playouts_per_sec": float(np.mean(playouts_per_second)) if playouts_per_second else None,
+        })
+        print("{algorithm:>19}: mean score {mean_score:.0f} {seconds_per_move:.4f}s/move".format(**results[-1]) +
+              (" {:.0f} playouts/sec".format(results[-1]["playouts_per_sec"]) if playouts_per_second else ""))
+    return results
+
+
+# ------------------------------- Afterstates -------------------------------
+def benchmark_afterstates(boards=2000, seed=0):
+    # microseconds per board to get the 4 afterstates: one Game clone and move per direction (which
+    # also spawns), 4 bitboard moves, one bitboard.afterstates call, and batch_game.afterstates
+    corpus = board_corpus(boards, seed)
+    packed = [bitboard.pack(matrix) for matrix in corpus]
+    games = [Game(matrix) for matrix in corpus]
+    cases = [
+        ("Game.clone + move", lambda: [game.clone().move(move) for game in games for move in range(4)]),
+        ("bitboard.MOVES", lambda: [bitboard.MOVES[move](board) for board in packed for move in range(4)]),
+        ("bitboard.afterstates", lambda: [bitboard.afterstates(board) for board in packed]),
+        ("batch_game.afterstates", lambda: batch_game.afterstates(np.array(packed, dtype=np.uint64))),
+    ]
+    results = []
+    for name, run in cases:
+        start_time = time.perf_counter()
+        run()
+        results.append({"method": name, "us_per_board": (time.perf_counter() - start_time) / boards * 1e6})
+        print("{method:>23}: {us_per_board:.2f} us/board".format(**results[-1]))
+    return results
+
+
+# ------------------------------- Position cache -------------------------------
+def benchmark_cache(games=3, passes=2, path=None, max_moves=None, seed=0):
+    # fixed-depth AStartAlgorithm plays the same seeded games `passes` times on one PositionCache file,
+    # the first pass filling it; reports the hit rate and search time saved of every game
+    from position_cache import PositionCache
+    import tempfile
+    directory = None
+    if path is None:
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "positions.pch")
+    cache = PositionCache(path)
+    results = []
+    try:
+        for game_pass in range(passes):
+            for i in range(games):
+                cache.reset_stats()
+                start_time = time.time()
+                game = play_seeded_game(AStartAlgorithm(seed=seed, cache=cache), seed + i, max_moves)
+                results.append(dict(cache.report(), game_pass=game_pass, seed=seed + i, score=game.true_score,
+                                    play_time=time.time() - start_time))
+                print("pass {game_pass} game {seed}: score {score} hit rate {hit_rate:.1%} ({hits}/{lookups}) "
+                      "saved {saved_time:.2f}s play time {play_time:.2f}s".format(**results[-1]))
+    finally:
+        cache.close()
+        if directory is not None:
+            os.remove(path)
+            os.rmdir(directory)
+    return results
+
+
+# ------------------------------- Import time -------------------------------
+def benchmark_imports(modules=("machine_player", "tournament", "puzzle"), repeat=5):
+    # best wall time of importing each module in a fresh interpreter, and whether that pulls in tkinter
+    results = []
+    for module in modules:
+        code = "import sys, time; start = time.perf_counter(); import {}; " \
+               "print(time.perf_counter() - start, 'tkinter' in sys.modules)".format(module)
+        timings = []
+        for _ in range(repeat):
+            output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split()
+            timings.append(float(output[0]))
+        results.append({"module": module, "import_ms": min(timings) * 1000, "imports_tkinter": output[1] == "True"})
+        print("{module:>15}: {import_ms:.1f} ms, imports tkinter: {imports_tkinter}".format(**results[-1]))
+    return results
+
+
+# ------------------------------- Benchmark suite -------------------------------
+SUITE_VERSION = 2  # 2: node budgets count applied moves (SearchStats.nodes) rather than expansions
+SUITE_PHASES = [("early", 0, 5), ("mid", 6, 10), ("late", 11, 16)]
+
+
+def time_per_call(setup, repeat=3):
+    # setup() returns (function, arguments) for one pass; the best pass is kept, in seconds per call
+    best = None
+    for _ in range(repeat):
+        function, arguments = setup()
+        start_time = time.perf_counter()
+        for argument in arguments:
+            function(argument)
+        elapsed = (time.perf_counter() - start_time) / len(arguments)
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def suite_cases(corpus, seed, node_budget):
+    # (name, setup) of every timed case on the boards of one phase; stateful players are recreated per pass
+    games = [Game(matrix) for matrix in corpus]
+    return [
+        ("logic.up", lambda: (logic.up, corpus)),
+        ("logic.down", lambda: (logic.down, corpus)),
+        ("logic.left", lambda: (logic.left, corpus)),
+        ("logic.right", lambda: (logic.right, corpus)),
+        ("logic.game_state", lambda: (logic.game_state, corpus)),
+        ("logic.add_two", lambda: (functools.partial(logic.add_two, rng=random.Random(seed)),
+                                   [[row[:] for row in matrix] for matrix in corpus])),
+        ("Game.clone", lambda: (Game.clone, games)),
+        ("UniformRandomAlgorithm", lambda: (UniformRandomAlgorithm(seed), corpus)),
+        ("DownLeftRightUpAlgorithm", lambda: (DownLeftRightUpAlgorithm(), corpus)),
+        ("AStartAlgorithm", lambda: (AStartAlgorithm(node_budget=node_budget, seed=seed), corpus)),
+        ("TDTreeSearchAlgorithm", lambda: (TDTreeSearchAlgorithm(node_budget=node_budget, seed=seed), corpus)),
+    ]
+
+
+def run_suite(boards=50, games=5, repeat=3, node_budget=3000, seed=0):
+    # seconds per call of the engine and every player on seeded early/mid/late boards, plus seconds per
+    # move of whole seeded games; node budgets keep the search players' work independent of the machine
+    results = {}
+    for phase, min_tiles, max_tiles in SUITE_PHASES:
+        corpus = board_corpus(boards, seed, min_tiles, max_tiles)
+        for name, setup in suite_cases(corpus, seed, node_budget):
+            results["{}[{}]".format(name, phase)] = time_per_call(setup, repeat)
+    for algorithm_class in [UniformRandomAlgorithm, DownLeftRightUpAlgorithm]:
+        best = None
+        for _ in range(repeat):
+            moves = 0
+            start_time = time.perf_counter()
+            for i in range(games):
+                algorithm = algorithm_class(seed + i) if algorithm_class is UniformRandomAlgorithm else algorithm_class()
+                moves += play_seeded_game(algorithm, seed + i).total_moves
+            elapsed = (time.perf_counter() - start_time) / moves
+            best = elapsed if best is None else min(best, elapsed)
+        results["game[{}]".format(algorithm_class.__name__)] = best
+    for name, seconds in results.items():
+        print("{:>40}: {:12.3f} us/call".format(name, seconds * 1e6))  # game[...] entries are per move
+    return {
+        "version": SUITE_VERSION,
+        "python": platform.python_version(),
+        "parameters": {"boards": boards, "games": games, "repeat": repeat, "node_budget": node_budget, "seed": seed},
+        "results": results,
+    }
+
+
+def compare_to_baseline(suite, baseline, threshold=0.1):
+    # names of the cases more than threshold (a fraction) slower than in the baseline
+    if baseline["parameters"] != suite["parameters"]:
+        print("Warning: baseline was run with {}".format(baseline["parameters"]))
+    regressions = []
+    for name, seconds in suite["results"].items():
+        if name not in baseline["results"]:
+            continue
+        ratio = seconds / baseline["results"][name]
+        regressed = ratio > 1 + threshold
+        if regressed:
+            regressions.append(name)
+        print("{:>40}: {:6.2f}x baseline{}".format(name, ratio, "  REGRESSION" if regressed else ""))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for the 2048 engine and players")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    parallel_parser = subparsers.add_parser("parallel", help="root-parallel AStartAlgorithm speedup by core count")
+    parallel_parser.add_argument("--boards", type=int, default=8)
+    parallel_parser.add_argument("--workers", type=int, default=None)
+    parallel_parser.add_argument("--seed", type=int, default=0)
+    symmetry_parser = subparsers.add_parser("symmetry", help="ExpectimaxAlgorithm cache hit rate with canonical keys")
+    symmetry_parser.add_argument("--boards", type=int, default=30)
+    symmetry_parser.add_argument("--depth", type=int, default=3)
+    symmetry_parser.add_argument("--seed", type=int, default=0)
+    heuristic_parser = subparsers.add_parser("heuristic", help="bonus-only vs heuristic leaf evaluation")
+    heuristic_parser.add_argument("--games", type=int, default=3)
+    heuristic_parser.add_argument("--time-budget", type=float, default=0.01)
+    heuristic_parser.add_argument("--max-moves", type=int, default=None)
+    heuristic_parser.add_argument("--seed", type=int, default=0)
+    nodes_parser = subparsers.add_parser("nodes", help="nodes/sec of Game.clone() vs SearchState apply/undo")
+    nodes_parser.add_argument("--boards", type=int, default=20)
+    nodes_parser.add_argument("--depth", type=int, default=3)
+    nodes_parser.add_argument("--seed", type=int, default=0)
+    sizes_parser = subparsers.add_parser("sizes", help="moves/sec of logic vs bitboard kernels by board size")
+    sizes_parser.add_argument("--boards", type=int, default=200)
+    sizes_parser.add_argument("--seed", type=int, default=0)
+    render_parser = subparsers.add_parser("render", help="GameGrid moves/sec, full vs changed-cell redraw")
+    render_parser.add_argument("--moves", type=int, default=500)
+    render_parser.add_argument("--seed", type=int, default=0)
+    montecarlo_parser = subparsers.add_parser("montecarlo", help="MonteCarloAlgorithm vs AStartAlgorithm")
+    montecarlo_parser.add_argument("--games", type=int, default=2)
+    montecarlo_parser.add_argument("--rollouts", type=int, default=50)
+    montecarlo_parser.add_argument("--max-moves", type=int, default=None)
+    montecarlo_parser.add_argument("--workers", type=int, default=0)
+    montecarlo_parser.add_argument("--processes", action="store_true", help="fan rollouts out to processes")
+    montecarlo_parser.add_argument("--seed", type=int, default=0)
+    afterstates_parser = subparsers.add_parser("afterstates", help="cost of the 4 afterstates of a board")
+    afterstates_parser.add_argument("--boards", type=int, default=2000)
+    afterstates_parser.add_argument("--seed", type=int, default=0)
+    cache_parser = subparsers.add_parser("cache", help="position cache hit rate over repeated seeded games")
+    cache_parser.add_argument("--games", type=int, default=3)
+    cache_parser.add_argument("--passes", type=int, default=2)
+    cache_parser.add_argument("--path", default=None, help="cache file to use and keep, a temporary one otherwise")
+    cache_parser.add_argument("--max-moves", type=int, default=None)
+    cache_parser.add_argument("--seed", type=int, default=0)
+    imports_parser = subparsers.add_parser("imports", help="import time of the entry points in a fresh interpreter")
+    imports_parser.add_argument("--repeat", type=int, default=5)
+    suite_parser = subparsers.add_parser("suite", help="seeded timing suite with JSON output and baseline comparison")
+    suite_parser.add_argument("--boards", type=int, default=50)
+    suite_parser.add_argument("--games", type=int, default=5)
+    suite_parser.add_argument("--repeat", type=int, default=3)
+    suite_parser.add_argument("--node-budget", type=int, default=3000)
+    suite_parser.add_argument("--seed", type=int, default=0)
+    suite_parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    suite_parser.add_argument("-b", "--baseline", help="compare against results saved with --output")
+    suite_parser.add_argument("-t", "--threshold", type=float, default=0.1,
+                              help="slowdown fraction that counts as a regression")
+    args = parser.parse_args()
+    if args.benchmark == "parallel":
+        benchmark_parallel(args.boards, args.workers, args.seed)
+    elif args.benchmark == "symmetry":
+        benchmark_symmetry(args.boards, args.depth, args.seed)
+    elif args.benchmark == "heuristic":
+        benchmark_heuristic(args.games, args.time_budget, args.seed, args.max_moves)
+    elif args.benchmark == "nodes":
+        benchmark_nodes(args.boards, args.depth, args.seed)
+    elif args.benchmark == "sizes":
+        benchmark_sizes(args.boards, seed=args.seed)
+    elif args.benchmark == "render":
+        benchmark_render(args.moves, args.seed)
+    elif args.benchmark == "montecarlo":
+        benchmark_montecarlo(args.games, args.rollouts, args.max_moves, args.workers, args.processes, args.seed)
+    elif args.benchmark == "afterstates":
+        benchmark_afterstates(args.boards, args.seed)
+    elif args.benchmark == "cache":
+        benchmark_cache(args.games, args.passes, args.path, args.max_moves, args.seed)
+    elif args.benchmark == "imports":
+        benchmark_imports(repeat=args.repeat)
+    elif args.benchmark == "suite":
+        suite = run_suite(args.boards, args.games, args.repeat, args.node_budget, args.seed)
+        if args.output:
+            with open(args.output, "w") as file:
+                json.dump(suite, file, indent=2)
+        if args.baseline:
+            with open(args.baseline) as file:
+                regressions = compare_to_baseline(suite, json.load(file), args.threshold)
+            if regressions:
+                print("{} regression(s) over {:.0%}".format(len(regressions), args.threshold))
+                sys.exit(1)
@@ -0,0 +1,552 @@
+#
+# Bitboard move engine
+#
+# A 4x4 board is packed into a single integer, one 4-bit nibble per cell
+# holding the log2 exponent of the tile (0 for an empty cell). Cell (i, j)
+# lives at bit offset 16 * i + 4 * j, so every row is a 16-bit chunk with
+# its leftmost cell in the lowest nibble.
+#
+# Moves are applied a row at a time through 65536-entry lookup tables that
+# are built once at import time; up/down are done by transposing the board,
+# moving it left/right and transposing it back.
+#
+# Boards of other sizes go through MoveKernel, which packs them the same way
+# and keeps one set of row tables per row length.
+#
+# The matrix API at the bottom (up/down/left/right) has the same
+# (matrix, done, bonus_score) semantics as the functions in logic.py, so
+# this module can be handed to Game as its engine.
+
+import itertools
+
+ROW_MASK = 0xFFFF
+MAX_EXPONENT = 15
+MAX_TILE = 1 << MAX_EXPONENT
+
+
+def _reverse_row(row, length=4):
+    reversed_row = 0
+    for j in range(length):
+        reversed_row |= (row >> (4 * j) & 0xF) << (4 * (length - 1 - j))
+    return reversed_row
+
+
+def _slide_tiles(tiles):
+    # the move rule: the nonzero exponents of a row, leftmost first, slid left and merged pairwise;
+    # returns the packed row and its merge bonus
+    packed = 0
+    bonus_score = 0
+    shift = 0
+    i = 0
+    while i < len(tiles):
+        tile = tiles[i]
+        # two 32768 tiles cannot be merged into a nibble, leave them alone
+        if i + 1 < len(tiles) and tile == tiles[i + 1] and tile < MAX_EXPONENT:
+            tile += 1
+            bonus_score += 1 << tile
+            i += 2
+        else:
+            i += 1
+        packed |= tile << shift
+        shift += 4
+    return packed, bonus_score
+
+
+def _slide_row_left(row, length=4):
+    return _slide_tiles([c for c in (row >> (4 * j) & 0xF for j in range(length)) if c])
+
+
+def _build_tables(length=4):
+    # every row is enumerated as its cells straight from itertools.product (highest cell first, so rows
+    # come out in increasing order), which is cheaper at import time than unpacking each row
+    size = 16 ** length
+    left = [0] * size
+    score = [0] * size
+    row = 0
+    for cells in itertools.product(range(16), repeat=length):
+        left[row], score[row] = _slide_tiles([c for c in reversed(cells) if c])
+        row += 1
+    reverse = [_reverse_row(row, length) for row in range(size)] if length != 4 else \
+        [(row & 0xF) << 12 | (row >> 4 & 0xF) << 8 | (row >> 8 & 0xF) << 4 | row >> 12 for row in range(size)]
+    right = [reverse[left[reverse[row]]] for row in range(size)]
+    return left, right, score
+
+
+ROW_LEFT, ROW_RIGHT, ROW_SCORE = _build_tables()
+
+
+# ------------------------------- Other row lengths -------------------------------
+# Rows of up to SPECIALIZED_ROW_LENGTH cells get complete lookup tables like the ones above (16 ** length
+# entries). Longer rows have too many possible values, so their tables are dicts filled in on first use.
+
+SPECIALIZED_ROW_LENGTH = 4
+
+
+class LazyRowTable(dict):
+    def __init__(self, length, kind):
+        super().__init__()
+        self.length = length
+        self.kind = kind
+
+    def __missing__(self, row):
+        if self.kind == "left":
+            value = _slide_row_left(row, self.length)[0]
+        elif self.kind == "right":
+            value = _reverse_row(_slide_row_left(_reverse_row(row, self.length), self.length)[0], self.length)
+        else:
+            value = _slide_row_left(row, self.length)[1]
+        self[row] = value
+        return value
+
+
+row_tables_by_length = {4: (ROW_LEFT, ROW_RIGHT, ROW_SCORE)}
+
+
+def row_tables(length):
+    # (left, right, score) tables for rows of the given length
+    if length not in row_tables_by_length:
+        if length <= SPECIALIZED_ROW_LENGTH:
+            left, right, score = _build_tables(length)
+        else:
+            left, right, score = (LazyRowTable(length, kind) for kind in ("left", "right", "score"))
+        row_tables_by_length[length] = (left, right, score)
+    return row_tables_by_length[length]
+
+
+# ------------------------------- Board packing -------------------------------
+def tile_overflow(value):
+    # a tile past 32768 would carry into the next cell's nibble
+    return ValueError("tile {} does not fit a 4-bit exponent".format(value))
+
+
+def pack(matrix):
+    board = 0
+    for i in range(4):
+        row = matrix[i]
+        for j in range(4):
+            value = row[j]
+            if value:
+                if value > MAX_TILE:
+                    raise tile_overflow(value)
+                board |= (value.bit_length() - 1) << (16 * i + 4 * j)
+    return board
+
+
+def unpack(board):
+    matrix = []
+    for i in range(4):
+        row = []
+        for j in range(4):
+            exponent = board >> (16 * i + 4 * j) & 0xF
+            row.append(1 << exponent if exponent else 0)
+        matrix.append(row)
+    return matrix
+
+
+def transpose(board):
+    a1 = board & 0xF0F00F0FF0F00F0F
+    a2 = board & 0x0000F0F00000F0F0
+    a3 = board & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+
+# ------------------------------- Empty cells and merges -------------------------------
+# empty_cells_mask marks every empty cell with a 1 in the lowest bit of its nibble, so a set bit's
+# position is the cell's shift. merge_lines has bit i set when row i can merge and bit 4 + j when
+# column j can.
+
+EMPTY_MARKERS = 0x1111111111111111
+ROW_CAN_MERGE = [score > 0 for score in ROW_SCORE]
+
+
+def empty_cells_mask(board):
+    occupied = board | board >> 1
+    occupied = (occupied | occupied >> 2) & EMPTY_MARKERS
+    return occupied ^ EMPTY_MARKERS
+
+
+def column(board, j):
+    shift = 4 * j
+    return (board >> shift & 0xF) | (board >> (12 + shift) & 0xF0) | \
+           (board >> (24 + shift) & 0xF00) | (board >> (36 + shift) & 0xF000)
+
+
+def merge_lines(board):
+    can_merge = ROW_CAN_MERGE
+    columns = transpose(board)
+    lines = 0
+    for i in range(4):
+        if can_merge[board >> (16 * i) & ROW_MASK]:
+            lines |= 1 << i
+        if can_merge[columns >> (16 * i) & ROW_MASK]:
+            lines |= 16 << i
+    return lines
+
+
+def update_merge_lines(board, lines, shift):
+    # only the row and the column of the cell at shift can change when that one cell changes
+    i = shift >> 4
+    j = (shift >> 2) & 3
+    lines &= ~((1 << i) | (16 << j))
+    if ROW_CAN_MERGE[board >> (16 * i) & ROW_MASK]:
+        lines |= 1 << i
+    if ROW_CAN_MERGE[column(board, j)]:
+        lines |= 16 << j
+    return lines
+
+
+def select_cell(mask, k):
+    # shift of the k-th set marker of an empty_cells_mask
+    for _ in range(k):
+        mask &= mask - 1
+    return (mask & -mask).bit_length() - 1
+
+
+# ------------------------------- Symmetries -------------------------------
+#
+# The 8 symmetries of the board are numbered by which of these are applied, in this order:
+# 1 = mirror every row (left <-> right), 2 = flip the rows (top <-> bottom), 4 = transpose.
+# These bit operations work on plain ints as well as on numpy uint64 arrays of boards.
+
+def mirror(board):
+    return ((board & 0x000F000F000F000F) << 12) | ((board & 0x00F000F000F000F0) << 4) | \
+           ((board & 0x0F000F000F000F00) >> 4) | ((board & 0xF000F000F000F000) >> 12)
+
+
+def flip(board):
+    return ((board & 0xFFFF) << 48) | ((board & 0xFFFF0000) << 16) | \
+           ((board & 0xFFFF00000000) >> 16) | ((board & 0xFFFF000000000000) >> 48)
+
+
+def apply_transform(board, transform):
+    if transform & 1:
+        board = mirror(board)
+    if transform & 2:
+        board = flip(board)
+    if transform & 4:
+        board = transpose(board)
+    return board
+
+
+def symmetries(board):
+    mirrored = mirror(board)
+    boards = [board, mirrored, flip(board), flip(mirrored)]
+    return boards + [transpose(b) for b in boards]
+
+
+def canonical(board):
+    # the smallest of the 8 symmetric boards and the transform that produces it
+    boards = symmetries(board)
+    best = min(boards)
+    return best, boards.index(best)
+
+
+# move numbers as used by Game.move: 0 up, 1 down, 2 left, 3 right
+MIRROR_MOVE = (0, 1, 3, 2)
+FLIP_MOVE = (1, 0, 2, 3)
+TRANSPOSE_MOVE = (2, 3, 0, 1)
+
+
+def transform_move(move, transform):
+    # a move on the original board -> the same move on the transformed board
+    if transform & 1:
+        move = MIRROR_MOVE[move]
+    if transform & 2:
+        move = FLIP_MOVE[move]
+    if transform & 4:
+        move = TRANSPOSE_MOVE[move]
+    return move
+
+
+def inverse_transform_move(move, transform):
+    # a move on the transformed board -> the same move on the original board
+    if transform & 4:
+        move = TRANSPOSE_MOVE[move]
+    if transform & 2:
+        move = FLIP_MOVE[move]
+    if transform & 1:
+        move = MIRROR_MOVE[move]
+    return move
+
+
+# ------------------------------- Packed board moves -------------------------------
+def _move_rows(board, table):
+    r0 = board & ROW_MASK
+    r1 = board >> 16 & ROW_MASK
+    r2 = board >> 32 & ROW_MASK
+    r3 = board >> 48 & ROW_MASK
+    result = table[r0] | (table[r1] << 16) | (table[r2] << 32) | (table[r3] << 48)
+    # merges pair up runs of equal tiles the same way in both directions,
+    # so one score table serves left and right moves
+    bonus_score = ROW_SCORE[r0] + ROW_SCORE[r1] + ROW_SCORE[r2] + ROW_SCORE[r3]
+    return result, result != board, bonus_score
+
+
+def move_left(board):
+    return _move_rows(board, ROW_LEFT)
+
+
+def move_right(board):
+    return _move_rows(board, ROW_RIGHT)
+
+
+def move_up(board):
+    result, done, bonus_score = _move_rows(transpose(board), ROW_LEFT)
+    return transpose(result), done, bonus_score
+
+
+def move_down(board):
+    result, done, bonus_score = _move_rows(transpose(board), ROW_RIGHT)
+    return transpose(result), done, bonus_score
+
+
+# indexed by the move numbers used by Game.move
+MOVES = (move_up, move_down, move_left, move_right)
+
+
+def move(board, direction):
+    return MOVES[direction](board)
+
+
+# ------------------------------- Afterstates -------------------------------
+# All 4 moves of a board at once, without spawning: the boards after up, down, left and right, their
+# merge bonus and a legality mask with bit m set when move m changes the board. Left and right read
+# the same rows and up and down the same columns, so the board is transposed and scored once per axis.
+
+def afterstates(board):
+    r0 = board & ROW_MASK
+    r1 = board >> 16 & ROW_MASK
+    r2 = board >> 32 & ROW_MASK
+    r3 = board >> 48 & ROW_MASK
+    left = ROW_LEFT[r0] | (ROW_LEFT[r1] << 16) | (ROW_LEFT[r2] << 32) | (ROW_LEFT[r3] << 48)
+    right = ROW_RIGHT[r0] | (ROW_RIGHT[r1] << 16) | (ROW_RIGHT[r2] << 32) | (ROW_RIGHT[r3] << 48)
+    row_bonus = ROW_SCORE[r0] + ROW_SCORE[r1] + ROW_SCORE[r2] + ROW_SCORE[r3]
+    columns = transpose(board)
+    c0 = columns & ROW_MASK
+    c1 = columns >> 16 & ROW_MASK
+    c2 = columns >> 32 & ROW_MASK
+    c3 = columns >> 48 & ROW_MASK
+    up = transpose(ROW_LEFT[c0] | (ROW_LEFT[c1] << 16) | (ROW_LEFT[c2] << 32) | (ROW_LEFT[c3] << 48))
+    down = transpose(ROW_RIGHT[c0] | (ROW_RIGHT[c1] << 16) | (ROW_RIGHT[c2] << 32) | (ROW_RIGHT[c3] << 48))
+    column_bonus = ROW_SCORE[c0] + ROW_SCORE[c1] + ROW_SCORE[c2] + ROW_SCORE[c3]
+    legal = (up != board) | (down != board) << 1 | (left != board) << 2 | (right != board) << 3
+    return (up, down, left, right), (column_bonus, column_bonus, row_bonus, row_bonus), legal
+
+
+def legal_moves(legal):
+    # the move numbers set in an afterstates legality mask
+    return [move for move in range(4) if legal >> move & 1]
+
+
+# ------------------------------- Boards of any size -------------------------------
+# A rows x cols board packs the same way with a row stride of 4 * cols bits. MoveKernel moves rows
+# through the row tables for their length and columns through the tables for the column length.
+# kernel(4, 4) is the fixed-size fast path above.
+
+class MoveKernel:
+
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        self.cells = rows * cols
+        self.row_bits = 4 * cols
+        self.row_mask = (1 << self.row_bits) - 1
+        self.row_left, self.row_right, self.row_score = row_tables(cols)
+        self.column_left, self.column_right, self.column_score = row_tables(rows)
+        self.empty_markers = sum(1 << (4 * k) for k in range(self.cells))
+        self.moves = (self.move_up, self.move_down, self.move_left, self.move_right)
+
+    def pack(self, matrix):
+        board = 0
+        shift = 0
+        for row in matrix:
+            for value in row:
+                if value:
+                    if value > MAX_TILE:
+                        raise tile_overflow(value)
+                    board |= (value.bit_length() - 1) << shift
+                shift += 4
+        return board
+
+    def unpack(self, board):
+        matrix = []
+        for i in range(self.rows):
+            row = []
+            for j in range(self.cols):
+                exponent = board >> (4 * (i * self.cols + j)) & 0xF
+                row.append(1 << exponent if exponent else 0)
+            matrix.append(row)
+        return matrix
+
+    def row(self, board, i):
+        return board >> (self.row_bits * i) & self.row_mask
+
+    def column(self, board, j):
+        line = 0
+        for i in range(self.rows):
+            line |= (board >> (4 * (i * self.cols + j)) & 0xF) << (4 * i)
+        return line
+
+    def move_rows(self, board, table):
+        result = 0
+        bonus_score = 0
+        for i in range(self.rows):
+            line = board >> (self.row_bits * i) & self.row_mask
+            result |= table[line] << (self.row_bits * i)
+            bonus_score += self.row_score[line]
+        return result, result != board, bonus_score
+
+    def move_columns(self, board, table):
+        result = 0
+        bonus_score = 0
+        for j in range(self.cols):
+            line = self.column(board, j)
+            moved = table[line]
+            for i in range(self.rows):
+                result |= (moved >> (4 * i) & 0xF) << (4 * (i * self.cols + j))
+            bonus_score += self.column_score[line]
+        return result, result != board, bonus_score
+
+    def move_left(self, board):
+        return self.move_rows(board, self.row_left)
+
+    def move_right(self, board):
+        return self.move_rows(board, self.row_right)
+
+    def move_up(self, board):
+        return self.move_columns(board, self.column_left)
+
+    def move_down(self, board):
+        return self.move_columns(board, self.column_right)
+
+    def move(self, board, direction):
+        return self.moves[direction](board)
+
+    def afterstates(self, board):
+        # same result as the module-level afterstates, one move at a time
+        boards = []
+        bonuses = []
+        legal = 0
+        for direction, move in enumerate(self.moves):
+            result, done, bonus_score = move(board)
+            boards.append(result)
+            bonuses.append(bonus_score)
+            legal |= done << direction
+        return tuple(boards), tuple(bonuses), legal
+
+    def empty_cells_mask(self, board):
+        occupied = board | board >> 1
+        occupied = (occupied | occupied >> 2) & self.empty_markers
+        return occupied ^ self.empty_markers
+
+    def merge_lines(self, board):
+        # bit i for row i, bit rows + j for column j
+        lines = 0
+        for i in range(self.rows):
+            if self.row_score[self.row(board, i)] > 0:
+                lines |= 1 << i
+        for j in range(self.cols):
+            if self.column_score[self.column(board, j)] > 0:
+                lines |= 1 << (self.rows + j)
+        return lines
+
+    def update_merge_lines(self, board, lines, shift):
+        i, j = divmod(shift >> 2, self.cols)
+        lines &= ~((1 << i) | (1 << (self.rows + j)))
+        if self.row_score[self.row(board, i)] > 0:
+            lines |= 1 << i
+        if self.column_score[self.column(board, j)] > 0:
+            lines |= 1 << (self.rows + j)
+        return lines
+
+
+class FourByFourKernel(MoveKernel):
+    # the module-level functions, which unroll the rows and transpose with a few bit operations
+
+    def __init__(self):
+        super().__init__(4, 4)
+        self.moves = MOVES
+
+    pack = staticmethod(pack)
+    unpack = staticmethod(unpack)
+    move_left = staticmethod(move_left)
+    move_right = staticmethod(move_right)
+    move_up = staticmethod(move_up)
+    move_down = staticmethod(move_down)
+    afterstates = staticmethod(afterstates)
+    empty_cells_mask = staticmethod(empty_cells_mask)
+    merge_lines = staticmethod(merge_lines)
+    update_merge_lines = staticmethod(update_merge_lines)
+
+
+kernels = {}
+
+
+def kernel(rows, cols=None):
+    cols = rows if cols is None else cols
+    if (rows, cols) not in kernels:
+        kernels[(rows, cols)] = FourByFourKernel() if (rows, cols) == (4, 4) else MoveKernel(rows, cols)
+    return kernels[(rows, cols)]
+
+
+def kernel_for(matrix):
+    return kernel(len(matrix), len(matrix[0]))
+
+
+# ------------------------------- Matrix API (same as logic.py) -------------------------------
+def _move_matrix(game, direction):
+    if len(game) == 4 and len(game[0]) == 4:
+        board, done, bonus_score = MOVES[direction](pack(game))
+        return (unpack(board), done, bonus_score)
+    size_kernel = kernel_for(game)
+    board, done, bonus_score = size_kernel.moves[direction](size_kernel.pack(game))
+    return (size_kernel.unpack(board), done, bonus_score)
+
+
+def up(game):
+    return _move_matrix(game, 0)
+
+
+def down(game):
+    return _move_matrix(game, 1)
+
+
+def left(game):
+    return _move_matrix(game, 2)
+
+
+def right(game):
+    return _move_matrix(game, 3)
+
+
+# ------------------------------- Cross-check against logic.py -------------------------------
+def random_matrix(rng, max_exponent=11, fill=0.6, rows=4, cols=4):
+    return [[(1 << rng.randint(1, max_exponent)) if rng.random() < fill else 0 for _ in range(cols)] for _ in range(rows)]
+
+
+def cross_check(boards=10000, seed=0, rows=4, cols=4):
+    import copy
+    import random
+    import logic
+    rng = random.Random(seed)
+    for _ in range(boards):
+        matrix = random_matrix(rng, fill=rng.random(), rows=rows, cols=cols)
+        size_kernel = kernel(rows, cols)
+        if size_kernel.unpack(size_kernel.pack(matrix)) != matrix:
+            raise AssertionError("pack/unpack mismatch on {}".format(matrix))
+        for name in ("up", "down", "left", "right"):
+            expected = getattr(logic, name)(copy.deepcopy(matrix))
+            actual = globals()[name](copy.deepcopy(matrix))
+            if tuple(expected) != tuple(actual):
+                raise AssertionError("{} mismatch on {}: logic gave {}, bitboard gave {}".format(name, matrix, expected, actual))
+    return boards
+
+
+if __name__ == "__main__":
+    for rows, cols in [(4, 4), (3, 3), (5, 5), (6, 6), (3, 5)]:
+        print("bitboard engine matches logic.py on", cross_check(2000 if (rows, cols) != (4, 4) else 10000, rows=rows,
+                                                                  cols=cols), "random {}x{} boards".format(rows, cols))
@@ -1,78 +1,113 @@
+import bitboard
 import logic
 import copy
+import random
 
 
 class Game:
 
-    def __init__(self, game=None):
+    # engine is any module with logic-style up/down/left/right functions,
+    # e.g. logic (default) or bitboard. size is the side of a square board or (rows, cols),
+    # a given matrix keeps its own size.
+    # Every game draws its spawns from its own rng: random.Random(seed) unless an rng is given.
+    # A spawn is a 4 with probability four_probability (0.1 for the standard 90%/10% split), a 2
+    # otherwise. Each spawn is recorded in self.spawns as (cell, value) with cell = row * cols + column;
+    # a game given that list as spawns places the same tiles in the same order before falling back to rng.
+    def __init__(self, game=None, engine=logic, size=4, seed=None, rng=None, four_probability=0.0, spawns=None):
+        self.engine = engine
+        self.rng = rng if rng is not None else random.Random(seed)
+        self.four_probability = four_probability
+        self.spawns = []
+        self.replay_spawns = list(spawns) if spawns is not None else []
         self.score = 0
         self.true_score = 0
         self.invalid_moves = 0
         self.total_moves = 0
         if game is not None:
             self.matrix = game
+            self.track_board()
         else:
-            self.matrix = logic.new_game(4)
-            logic.add_two(self.matrix)
-            logic.add_two(self.matrix)
+            rows, cols = size if isinstance(size, tuple) else (size, size)
+            self.matrix = logic.new_game(rows, cols)
+            self.track_board()
+            self.add_two()
+            self.add_two()
 
     def up(self):
-        self.matrix, done, bonus_score = logic.up(self.matrix)
-        self.total_moves += 1
-        if done:
-            logic.add_two(self.matrix)
-            self.score += bonus_score
-            self.true_score += bonus_score
-        else:
-            self.invalid_moves += 1
-            self.score -=1
-            bonus_score = -1
-        return bonus_score
+        return self.play(*self.engine.up(self.matrix))
 
     def down(self):
-        self.matrix, done, bonus_score = logic.down(self.matrix)
-        self.total_moves += 1
-        if done:
-            logic.add_two(self.matrix)
-            self.score += bonus_score
-            self.true_score += bonus_score
-        else:
-            self.invalid_moves += 1
-            self.score -=1
-            bonus_score = -1
-        return bonus_score
+        return self.play(*self.engine.down(self.matrix))
 
     def right(self):
-        self.matrix, done, bonus_score = logic.right(self.matrix)
-        self.total_moves += 1
-        if done:
-            logic.add_two(self.matrix)
-            self.score += bonus_score
-            self.true_score += bonus_score
-        else:
-            self.invalid_moves += 1
-            self.score -= 1
-            bonus_score = -1
-        return bonus_score
+        return self.play(*self.engine.right(self.matrix))
 
     def left(self):
-        self.matrix, done, bonus_score = logic.left(self.matrix)
+        return self.play(*self.engine.left(self.matrix))
+
+    def play(self, matrix, done, bonus_score):
+        # finishes a move from its (matrix, done, bonus_score) result, as returned by the engine or
+        # taken from afterstates(): the tile spawns only now
         self.total_moves += 1
         if done:
-            logic.add_two(self.matrix)
+            self.matrix = matrix
+            self.track_board()
+            self.add_two()
             self.score += bonus_score
             self.true_score += bonus_score
         else:
             self.invalid_moves += 1
-            self.score -=1
+            self.score -= 1
             bonus_score = -1
         return bonus_score
 
+    def afterstates(self):
+        # the matrix after each move (None when illegal), the merge bonuses and the legality mask of
+        # bitboard.afterstates, without spawning or changing the game
+        if self.engine is not bitboard and max(map(max, self.matrix)) >= bitboard.MAX_TILE:
+            # two 32768 tiles merge past a 4-bit exponent, only the engine itself can play this board
+            results = (self.engine.up(self.matrix), self.engine.down(self.matrix),
+                       self.engine.left(self.matrix), self.engine.right(self.matrix))
+            matrices = [matrix if done else None for matrix, done, _ in results]
+            bonuses = tuple(bonus_score if done else 0 for _, done, bonus_score in results)
+            legal = sum(1 << move for move, (_, done, _) in enumerate(results) if done)
+            return matrices, bonuses, legal
+        kernel = bitboard.kernel_for(self.matrix)
+        boards, bonuses, legal = kernel.afterstates(kernel.pack(self.matrix))
+        matrices = [kernel.unpack(board) if legal >> move & 1 else None for move, board in enumerate(boards)]
+        return matrices, bonuses, legal
+
     def clone(self):
-        return copy.deepcopy(self)
+        # the engine and the rng are shared rather than copied, so clones keep drawing from one stream
+        return copy.deepcopy(self, {id(self.engine): self.engine, id(self.rng): self.rng})
+
+    # empty cells and mergeable rows/columns are tracked as bitmasks (see logic.board_masks) so is_over
+    # doesn't rescan the matrix and add_two picks its cell straight from the mask
+    def track_board(self):
+        self.empty_mask, self.merge_lines = logic.board_masks(self.matrix)
+
+    def add_two(self):
+        if self.empty_mask == 0:
+            return
+        cols = len(self.matrix[0])
+        if len(self.spawns) < len(self.replay_spawns):
+            cell, value = self.replay_spawns[len(self.spawns)]
+            if not self.empty_mask >> cell & 1:
+                raise ValueError("replayed spawn {} lands on an occupied cell".format(len(self.spawns)))
+            i, j = divmod(cell, cols)
+            self.matrix[i][j] = value
+        else:
+            value = 4 if self.four_probability and self.rng.random() < self.four_probability else 2
+            i, j = logic.add_two_from_mask(self.matrix, self.empty_mask, self.rng, value)
+        self.spawns.append((i * cols + j, value))
+        self.empty_mask &= ~(1 << (i * cols + j))
+        self.merge_lines = logic.update_merge_lines(self.matrix, self.merge_lines, i, j)
 
     def is_over(self):
-        return logic.game_state(self.matrix) == "lose"
+        return self.empty_mask == 0 and self.merge_lines == 0
+
+    def size(self):
+        return len(self.matrix), len(self.matrix[0])
 
     def move(self, move):
         if move == 0:
@@ -97,17 +132,29 @@ class Game:
         return largest
 
     def multi_move(self, moves):
+        # plays moves in order until one scores; the afterstates of a board are computed once, so the
+        # invalid moves tried on it don't each go through the engine
         result = -1
-        for i in range(len(moves)):
-            move = moves[i]
-            result = self.move(move)
+        afterstates = None
+        for move in moves:
+            if move not in (0, 1, 2, 3):
+                result = -1
+                continue
+            if afterstates is None:
+                afterstates = self.afterstates()
+            matrices, bonuses, legal = afterstates
+            if legal >> move & 1:
+                result = self.play(matrices[move], True, bonuses[move])
+                afterstates = None
+            else:
+                result = self.play(self.matrix, False, 0)
             if result > 0:
                 return result
         return result
 
     def dump(self):
         print("score: ", self.score)
-        for i in range(4):
-            for j in range(4):
+        for i in range(len(self.matrix)):
+            for j in range(len(self.matrix[0])):
                 print(self.matrix[i][j], "\t", end="")
             print("")
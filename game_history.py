@@ -1,23 +1,236 @@
+import itertools
 import json
+import os
+import struct
 import time
+import bitboard
 
 
 class GameHistory:
-    def __init__(self):
+    def __init__(self, samples_directory_name=None):
+        self.samples_directory_name = samples_directory_name
         self.game_steps = []
         self.total_score = 0
         self.invalid_moves = 0
         self.total_moves = 0
 
-    def add_step(self, matrix, move, move_score, total_score):
-        self.game_steps.append(
-            {
-                "game_state": matrix,
-                "move": move,
-                "move_score": move_score,
-                "total_score_after_move": total_score
-            })
+    def add_step(self, matrix, move, move_score, total_score, search_stats=None):
+        step = {
+            "game_state": matrix,
+            "move": move,
+            "move_score": move_score,
+            "total_score_after_move": total_score
+        }
+        if search_stats is not None:
+            step["search_stats"] = search_stats
+        self.game_steps.append(step)
 
     def dump_to_file(self, path):
+        data = dict(self.__dict__)
+        data.pop("samples_directory_name")
         with open(path, "w") as file:
-            file.write(json.dumps(self.__dict__))
+            file.write(json.dumps(data))
+
+    def close(self):
+        # same end of game call as GameHistoryWriter, for boards too large for .hxp v2
+        os.makedirs(self.samples_directory_name, exist_ok=True)
+        path = unique_history_path(self.samples_directory_name)
+        self.dump_to_file(path)
+        return path
+
+
+# ------------------------------- Binary .hxp v2 format -------------------------------
+#
+# A 32 byte header followed by one fixed-size record per step:
+#   header: magic "HXP2", version, flags, rows, cols, total_score, invalid_moves, total_moves, step_count
+#   step:   board before the move packed by bitboard.kernel(rows, cols), move, move score, total score after the move
+# A step board is one 64-bit word, so boards of up to 16 cells are stored; larger ones use GameHistory.
+# The header is rewritten with the final stats and FLAG_FINISHED when the game ends. The writer flushes
+# every flush_every steps, so a file whose writer died early keeps the steps up to its last flush (at
+# most flush_every - 1 steps are lost); its step count is recovered from the file size.
+# Search statistics of the steps (search_stats.SearchStats.as_dict) go to a JSON lines sidecar,
+# <file>.stats.jsonl, one {"step": index, ...} object per instrumented step.
+
+HXP2_MAGIC = b"HXP2"
+HXP2_VERSION = 2
+HEADER = struct.Struct("<4sBBBBIIIQ4x")
+STEP = struct.Struct("<QBiI")
+FLAG_FINISHED = 1
+
+path_counter = itertools.count()
+
+
+def unique_history_path(directory):
+    # nanosecond time, pid and a per-process counter keep games finishing together apart
+    return os.path.join(directory, "{}-{}-{}.hxp".format(time.time_ns(), os.getpid(), next(path_counter)))
+
+
+def stats_path(path):
+    return path + ".stats.jsonl"
+
+
+class GameHistoryWriter:
+    # Same add_step interface as GameHistory, but every step is appended to the file as it is played.
+    # The file is created on the first step (or on close) with a name that never collides, and written
+    # out every flush_every steps through a buffer just large enough to hold them.
+
+    def __init__(self, samples_directory_name, flush_every=64, rows=4, cols=4):
+        if rows * cols > 16:
+            raise ValueError("a {}x{} board does not fit a .hxp v2 step".format(rows, cols))
+        self.samples_directory_name = samples_directory_name
+        self.kernel = bitboard.kernel(rows, cols)
+        self.flush_every = max(1, flush_every)
+        self.buffer_size = HEADER.size + self.flush_every * STEP.size
+        self.path = None
+        self.file = None
+        self.stats_file = None
+        self.step_count = 0
+        self.total_score = 0
+        self.invalid_moves = 0
+        self.total_moves = 0
+
+    def open(self):
+        os.makedirs(self.samples_directory_name, exist_ok=True)
+        while self.file is None:
+            self.path = unique_history_path(self.samples_directory_name)
+            try:
+                self.file = open(self.path, "xb", buffering=self.buffer_size)
+            except FileExistsError:
+                continue
+        self.write_header(0)
+
+    def write_header(self, flags):
+        self.file.write(HEADER.pack(HXP2_MAGIC, HXP2_VERSION, flags, self.kernel.rows, self.kernel.cols,
+                                    self.total_score, self.invalid_moves, self.total_moves, self.step_count))
+
+    def add_step(self, matrix, move, move_score, total_score, search_stats=None):
+        if self.file is None:
+            self.open()
+        self.file.write(STEP.pack(self.kernel.pack(matrix), move, move_score, total_score))
+        if search_stats is not None:
+            if self.stats_file is None:
+                self.stats_file = open(stats_path(self.path), "w")
+            self.stats_file.write(json.dumps(dict(search_stats, step=self.step_count)) + "\n")
+        self.step_count += 1
+        if self.step_count % self.flush_every == 0:
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        if self.stats_file is not None:
+            self.stats_file.flush()
+
+    def close(self):
+        if self.file is None:
+            self.open()
+        self.file.seek(0)
+        self.write_header(FLAG_FINISHED)
+        self.file.close()
+        if self.stats_file is not None:
+            self.stats_file.close()
+        return self.path
+
+
+def create_history(samples_directory_name, rows=4, cols=4):
+    # .hxp v2 writer when the board fits a step record, JSON GameHistory otherwise
+    if rows * cols <= 16:
+        return GameHistoryWriter(samples_directory_name, rows=rows, cols=cols)
+    return GameHistory(samples_directory_name)
+
+
+def read_header(file):
+    data = file.read(HEADER.size)
+    if len(data) < HEADER.size:
+        return None
+    magic, version, flags, rows, cols, total_score, invalid_moves, total_moves, step_count = HEADER.unpack(data)
+    if magic != HXP2_MAGIC:
+        return None
+    return {
+        "version": version,
+        "finished": bool(flags & FLAG_FINISHED),
+        "rows": rows,
+        "cols": cols,
+        "total_score": total_score,
+        "invalid_moves": invalid_moves,
+        "total_moves": total_moves,
+        "step_count": step_count,
+    }
+
+
+def is_binary_history(path):
+    with open(path, "rb") as file:
+        return file.read(len(HXP2_MAGIC)) == HXP2_MAGIC
+
+
+def iter_steps(path):
+    # yields (board, move, move_score, total_score) without loading the whole file
+    with open(path, "rb") as file:
+        if read_header(file) is None:
+            raise ValueError("{} is not a .hxp v2 file".format(path))
+        while True:
+            data = file.read(STEP.size * 1024)
+            for i in range(0, len(data) - STEP.size + 1, STEP.size):
+                yield STEP.unpack_from(data, i)
+            if len(data) < STEP.size * 1024:
+                return
+
+
+def read_history(path):
+    # loads a .hxp file of either format into a GameHistory
+    history = GameHistory()
+    if is_binary_history(path):
+        with open(path, "rb") as file:
+            header = read_header(file)
+        kernel = bitboard.kernel(header["rows"], header["cols"])
+        search_stats = {}
+        if os.path.exists(stats_path(path)):
+            with open(stats_path(path)) as file:
+                for line in file:
+                    stats = json.loads(line)
+                    search_stats[stats.pop("step")] = stats
+        for step, (board, move, move_score, total_score) in enumerate(iter_steps(path)):
+            history.add_step(kernel.unpack(board), move, move_score, total_score, search_stats.get(step))
+        history.total_score = header["total_score"]
+        history.invalid_moves = header["invalid_moves"]
+        history.total_moves = header["total_moves"]
+    else:
+        with open(path) as file:
+            history.__dict__.update(json.load(file))
+    return history
+
+
+# ------------------------------- JSON to v2 conversion -------------------------------
+def convert_json_history(source_path, samples_directory_name):
+    with open(source_path) as file:
+        data = json.load(file)
+    steps = data["game_steps"]
+    rows, cols = (len(steps[0]["game_state"]), len(steps[0]["game_state"][0])) if steps else (4, 4)
+    writer = GameHistoryWriter(samples_directory_name, rows=rows, cols=cols)
+    for step in steps:
+        writer.add_step(step["game_state"], step["move"], step["move_score"], step["total_score_after_move"])
+    writer.total_score = data["total_score"]
+    writer.invalid_moves = data["invalid_moves"]
+    writer.total_moves = data["total_moves"]
+    return writer.close()
+
+
+def convert_directory(source_directory, samples_directory_name):
+    converted = 0
+    for name in sorted(os.listdir(source_directory)):
+        path = os.path.join(source_directory, name)
+        if not name.endswith(".hxp") or is_binary_history(path):
+            continue
+        try:
+            convert_json_history(path, samples_directory_name)
+            converted += 1
+        except (ValueError, KeyError) as error:
+            print("Skipping {}: {}".format(path, error))
+    return converted
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) != 3:
+        print("usage: python game_history.py SOURCE_DIRECTORY DESTINATION_DIRECTORY")
+        sys.exit(1)
+    print("Converted", convert_directory(sys.argv[1], sys.argv[2]), "games")
@@ -0,0 +1,320 @@
+import asyncio
+import itertools
+import random
+import time
+import numpy as np
+import bitboard
+from game import Game
+from game_history import create_history
+
+#
+# Asyncio game server for remote players
+#
+# One process hosts many independent Game sessions and serves them over TCP or a Unix socket with a
+# line protocol, one request per line and one response line per request, in order:
+#
+#   new [seed]             ok <session> <board>               starts a game
+#   move <session> <m>...  ok <score> <over> <bonus>...       plays the moves in order (0 up, 1 down,
+#                                                              2 left, 3 right), stopping when the game ends
+#   state <session>        ok <score> <moves> <over> <board>
+#   close <session>        ok <score>
+#   anything failing       err <message>
+#
+# Boards are the packed bitboard in hex (bitboard.pack), scores are true scores, over is 0 or 1 and a
+# bonus is Game.move's result, -1 for an invalid move. Clients may pipeline: requests are read and
+# answered one after the other, and a connection is not read while its responses wait for the client
+# to take them (StreamWriter.drain), so a client that doesn't read blocks only itself. Sessions unused
+# for idle_timeout seconds are closed, and new games are refused past max_sessions. With a
+# samples directory every session is recorded like a BackgroundMachinePlayer game.
+#
+
+MAX_LINE = 64 * 1024
+MAX_MOVES_PER_REQUEST = 4096
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class Session:
+
+    def __init__(self, session_id, seed, samples_directory_name=None):
+        self.session_id = session_id
+        self.game = Game(engine=bitboard, seed=seed)
+        self.history = create_history(samples_directory_name) if samples_directory_name is not None else None
+        self.last_used = time.monotonic()
+
+    def move(self, moves):
+        bonuses = []
+        for move in moves:
+            if self.game.is_over():
+                break
+            matrix = self.game.matrix
+            bonus_score = self.game.move(move)
+            if self.history is not None and bonus_score != -1:
+                self.history.add_step(matrix, move, bonus_score, self.game.true_score)
+            bonuses.append(bonus_score)
+        return bonuses
+
+    def close(self):
+        if self.history is not None:
+            self.history.total_moves = self.game.total_moves
+            self.history.invalid_moves = self.game.invalid_moves
+            self.history.total_score = self.game.true_score
+            self.history.close()
+            self.history = None
+
+
+class GameServer:
+
+    def __init__(self, samples_directory_name=None, idle_timeout=300.0, max_sessions=100000):
+        self.samples_directory_name = samples_directory_name
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.sessions = {}
+        self.session_ids = itertools.count(1)
+        self.requests = 0
+        self.connections = set()  # tasks serving the open connections
+        self.server = None
+        self.reaper = None
+
+    # ------------------------------- Requests -------------------------------
+    def session(self, fields):
+        if len(fields) < 2:
+            raise ProtocolError("missing session")
+        session = self.sessions.get(parse_int(fields[1]))
+        if session is None:
+            raise ProtocolError("no session {}".format(fields[1]))
+        session.last_used = time.monotonic()
+        return session
+
+    def new_game(self, fields):
+        if len(self.sessions) >= self.max_sessions:
+            raise ProtocolError("busy")
+        seed = parse_int(fields[1]) if len(fields) > 1 else None
+        session = Session(next(self.session_ids), seed, self.samples_directory_name)
+        self.sessions[session.session_id] = session
+        return "ok {} {:x}".format(session.session_id, bitboard.pack(session.game.matrix))
+
+    def move(self, fields):
+        session = self.session(fields)
+        if len(fields) - 2 > MAX_MOVES_PER_REQUEST:
+            raise ProtocolError("more than {} moves".format(MAX_MOVES_PER_REQUEST))
+        moves = [parse_int(field) for field in fields[2:]]
+        if any(move not in (0, 1, 2, 3) for move in moves):
+            raise ProtocolError("moves are 0 to 3")
+        bonuses = session.move(moves)
+        game = session.game
+        return " ".join(["ok", str(game.true_score), str(int(game.is_over()))] + [str(bonus) for bonus in bonuses])
+
+    def state(self, fields):
+        game = self.session(fields).game
+        return "ok {} {} {} {:x}".format(game.true_score, game.total_moves, int(game.is_over()),
+                                         bitboard.pack(game.matrix))
+
+    def close_session(self, fields):
+        session = self.session(fields)
+        del self.sessions[session.session_id]
+        session.close()
+        return "ok {}".format(session.game.true_score)
+
+    COMMANDS = {"new": new_game, "move": move, "state": state, "close": close_session}
+
+    def handle(self, line):
+        self.requests += 1
+        fields = line.split()
+        try:
+            if not fields or fields[0] not in self.COMMANDS:
+                raise ProtocolError("unknown command")
+            return self.COMMANDS[fields[0]](self, fields)
+        except ProtocolError as error:
+            return "err {}".format(error)
+        except Exception as error:  # a failing request must not take the connection down
+            return "err {}: {}".format(type(error).__name__, error)
+
+    # ------------------------------- Connections -------------------------------
+    async def serve_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self.connections.add(task)
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:  # longer than MAX_LINE, the stream can't be resynchronized
+                    writer.write(b"err line too long\n")
+                    break
+                if not line:
+                    break
+                response = self.handle(line.decode("ascii", "replace"))
+                writer.write(response.encode("ascii", "backslashreplace") + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):  # cancelled by close()
+            pass
+        finally:
+            self.connections.discard(task)
+            writer.close()
+
+    async def reap_idle_sessions(self):
+        while True:
+            await asyncio.sleep(min(self.idle_timeout, 10.0))
+            deadline = time.monotonic() - self.idle_timeout
+            for session_id in [session_id for session_id, session in self.sessions.items()
+                               if session.last_used < deadline]:
+                self.sessions.pop(session_id).close()
+
+    async def start(self, host="127.0.0.1", port=2048, path=None):
+        # a Unix socket at path when given, TCP otherwise (port 0 picks a free one, see address())
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self.serve_connection, path, limit=MAX_LINE)
+        else:
+            self.server = await asyncio.start_server(self.serve_connection, host, port, limit=MAX_LINE)
+        self.reaper = asyncio.ensure_future(self.reap_idle_sessions())
+        return self.server
+
+    def address(self):
+        return self.server.sockets[0].getsockname()
+
+    async def close(self):
+        self.reaper.cancel()
+        self.server.close()
+        connections = list(self.connections)
+        for task in connections:
+            task.cancel()
+        await asyncio.gather(*connections)
+        await self.server.wait_closed()
+        for session in self.sessions.values():
+            session.close()
+        self.sessions.clear()
+
+
+def parse_int(field):
+    try:
+        return int(field)
+    except ValueError:
+        raise ProtocolError("not a number: {}".format(field))
+
+
+# ------------------------------- Load test client -------------------------------
+async def open_connection(host, port, path):
+    if path is not None:
+        return await asyncio.open_unix_connection(path, limit=MAX_LINE)
+    return await asyncio.open_connection(host, port, limit=MAX_LINE)
+
+
+async def play_connection(host, port, path, requests, batch, pipeline, seed, latencies):
+    # plays random games until `requests` move requests are answered, keeping up to `pipeline`
+    # requests in flight; a game that ends is closed and replaced by a new one. Returns the moves the
+    # server played, which are fewer than sent when a game ends within a batch
+    reader, writer = await open_connection(host, port, path)
+    rng = random.Random(seed)
+    games = itertools.count(seed * 1000003)
+
+    async def request(line):
+        start_time = time.perf_counter()
+        writer.write(line.encode("ascii") + b"\n")
+        response = (await reader.readline()).decode("ascii").split()
+        latencies.append(time.perf_counter() - start_time)
+        if not response or response[0] != "ok":
+            raise RuntimeError("server answered {!r} to {!r}".format(" ".join(response), line))
+        return response
+
+    sessions = [(await request("new {}".format(next(games))))[1] for _ in range(pipeline)]
+    sent = 0
+    played = 0
+    while sent < requests:
+        count = min(pipeline, requests - sent)
+        sent_times = []
+        for session in sessions[:count]:
+            moves = " ".join(str(rng.randrange(4)) for _ in range(batch))
+            writer.write("move {} {}\n".format(session, moves).encode("ascii"))
+            sent_times.append(time.perf_counter())
+        await writer.drain()
+        finished = []
+        for k in range(count):
+            response = (await reader.readline()).decode("ascii").split()
+            latencies.append(time.perf_counter() - sent_times[k])
+            if not response or response[0] != "ok":
+                raise RuntimeError("server answered {!r}".format(" ".join(response)))
+            played += len(response) - 3  # one bonus per move played
+            if response[2] == "1":
+                finished.append(k)
+        for k in finished:
+            await request("close {}".format(sessions[k]))
+            sessions[k] = (await request("new {}".format(next(games))))[1]
+        sent += count
+    for session in sessions:
+        await request("close {}".format(session))
+    writer.close()
+    return played
+
+
+async def load_test(host="127.0.0.1", port=2048, path=None, connections=10, requests=1000, batch=1, pipeline=1,
+                    seed=0):
+    # requests move requests of batch random moves on each connection; returns requests/sec, moves/sec
+    # (of the moves the server played) and latency percentiles over every request (new and close included)
+    latencies = []
+    start_time = time.perf_counter()
+    played = await asyncio.gather(*[play_connection(host, port, path, requests, batch, pipeline, seed + c, latencies)
+                                   for c in range(connections)])
+    elapsed = time.perf_counter() - start_time
+    latencies = np.array(latencies)
+    return {
+        "connections": connections,
+        "requests": len(latencies),
+        "requests_per_second": len(latencies) / elapsed,
+        "moves_per_second": sum(played) / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+        "seconds": elapsed,
+    }
+
+
+async def load_test_local(**kwargs):
+    # load test against a server started in this process on a free port
+    server = GameServer()
+    await server.start(port=0)
+    try:
+        host, port = server.address()[:2]
+        return await load_test(host, port, **kwargs)
+    finally:
+        await server.close()
+
+
+async def serve(args):
+    server = GameServer(args.samples, args.idle_timeout, args.max_sessions)
+    await server.start(args.host, args.port, args.unix)
+    print("Serving on", args.unix or "{}:{}".format(*server.address()[:2]))
+    await server.server.serve_forever()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="2048 game server and load test client")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve")
+    load_parser = subparsers.add_parser("load", help="load test a running server, or a local one with --local")
+    for subparser in (serve_parser, load_parser):
+        subparser.add_argument("--host", default="127.0.0.1")
+        subparser.add_argument("--port", type=int, default=2048)
+        subparser.add_argument("--unix", default=None, help="Unix socket path instead of TCP")
+    serve_parser.add_argument("--samples", default=None, help="record every session to this directory")
+    serve_parser.add_argument("--idle-timeout", type=float, default=300.0)
+    serve_parser.add_argument("--max-sessions", type=int, default=100000)
+    load_parser.add_argument("--local", action="store_true", help="start a server in this process")
+    load_parser.add_argument("--connections", type=int, default=10)
+    load_parser.add_argument("--requests", type=int, default=1000, help="move requests per connection")
+    load_parser.add_argument("--batch", type=int, default=1, help="moves per request")
+    load_parser.add_argument("--pipeline", type=int, default=1, help="requests in flight per connection")
+    load_parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.command == "serve":
+        asyncio.run(serve(args))
+    else:
+        options = dict(connections=args.connections, requests=args.requests, batch=args.batch,
+                       pipeline=args.pipeline, seed=args.seed)
+        if args.local:
+            report = asyncio.run(load_test_local(**options))
+        else:
+            report = asyncio.run(load_test(args.host, args.port, args.unix, **options))
+        for name, value in report.items():
+            print("{}: {}".format(name, round(value, 3) if isinstance(value, float) else value))
@@ -0,0 +1,80 @@
+import bitboard
+
+#
+# Leaf evaluation functions for the search players
+#
+# An evaluator is called with a packed bitboard and returns the value of the position on top of the
+# merge bonus already collected on the way to it. lost_value is used for boards with no legal move.
+#
+# HeuristicEvaluator precomputes the weighted sum of its terms for every possible 16-bit line, so a
+# board costs 4 row and 4 column lookups. Both evaluators expect 4x4 boards.
+#
+
+
+class BonusEvaluator:
+    # today's scoring: a leaf is worth nothing beyond the merge bonus
+    lost_value = 0
+
+    def __call__(self, board):
+        return 0
+
+
+line_tables = {}  # weights -> table, shared by every evaluator with the same weights in this process
+
+
+def line_value(line, monotonicity, monotonicity_power, empty, merges, corner, corner_power):
+    ranks = [line >> (4 * j) & 0xF for j in range(4)]
+    empty_cells = ranks.count(0)
+    merge_count = 0
+    previous = 0
+    for rank in ranks:
+        if rank == 0:
+            continue
+        if rank == previous:
+            merge_count += 1
+            previous = 0
+        else:
+            previous = rank
+    increasing = 0
+    decreasing = 0
+    for j in range(1, 4):
+        if ranks[j - 1] > ranks[j]:
+            decreasing += ranks[j - 1] ** monotonicity_power - ranks[j] ** monotonicity_power
+        else:
+            increasing += ranks[j] ** monotonicity_power - ranks[j - 1] ** monotonicity_power
+    largest = max(ranks)
+    in_corner = largest > 0 and (ranks[0] == largest or ranks[3] == largest)
+    return empty * empty_cells + merges * merge_count - monotonicity * min(increasing, decreasing) + \
+        (corner * largest ** corner_power if in_corner else 0)
+
+
+def build_line_table(weights):
+    if weights not in line_tables:
+        line_tables[weights] = [line_value(line, *weights) for line in range(65536)]
+    return line_tables[weights]
+
+
+class HeuristicEvaluator:
+
+    def __init__(self, monotonicity=47.0, monotonicity_power=2.0, empty=270.0, merges=700.0, corner=1.0,
+                 corner_power=2.0, lost_value=-200000.0):
+        self.weights = (monotonicity, monotonicity_power, empty, merges, corner, corner_power)
+        self.lost_value = lost_value
+        self.table = build_line_table(self.weights)
+
+    # only the weights are pickled (e.g. for worker processes), the table is rebuilt on the other side
+    def __getstate__(self):
+        return {"weights": self.weights, "lost_value": self.lost_value}
+
+    def __setstate__(self, state):
+        self.weights = state["weights"]
+        self.lost_value = state["lost_value"]
+        self.table = build_line_table(self.weights)
+
+    def __call__(self, board):
+        table = self.table
+        columns = bitboard.transpose(board)
+        return table[board & 0xFFFF] + table[board >> 16 & 0xFFFF] + \
+            table[board >> 32 & 0xFFFF] + table[board >> 48 & 0xFFFF] + \
+            table[columns & 0xFFFF] + table[columns >> 16 & 0xFFFF] + \
+            table[columns >> 32 & 0xFFFF] + table[columns >> 48 & 0xFFFF]
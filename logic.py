@@ -16,11 +16,12 @@ from random import *
 # Matrix elements must be equal but not identical
 # 1 mark for creating the correct matrix
 
-def new_game(n):
+def new_game(n, m=None):
     matrix = []
+    m = n if m is None else m
 
     for i in range(n):
-        matrix.append([0] * n)
+        matrix.append([0] * m)
     return matrix
 
 ###########
@@ -32,13 +33,12 @@ def new_game(n):
 # Must ensure that it is created on a zero entry
 # 1 mark for creating the correct loop
 
-def add_two(mat):
-    a=randint(0,len(mat)-1)
-    b=randint(0,len(mat)-1)
-    while(mat[a][b]!=0):
-        a=randint(0,len(mat)-1)
-        b=randint(0,len(mat)-1)
-    mat[a][b]=2
+def add_two(mat, rng=None):
+    # pick uniformly among the empty cells directly instead of retrying random cells
+    cells=[(i,j) for i in range(len(mat)) for j in range(len(mat[0])) if mat[i][j]==0]
+    if cells:
+        a,b=choice(cells) if rng is None else rng.choice(cells)
+        mat[a][b]=2
     return mat
 
 ###########
@@ -62,14 +62,84 @@ def game_state(mat):
         for j in range(len(mat[0])):
             if mat[i][j]==0:
                 return 'not over'
-    for k in range(len(mat)-1): #to check the left/right entries on the last row
+    for k in range(len(mat[0])-1): #to check the left/right entries on the last row
         if mat[len(mat)-1][k]==mat[len(mat)-1][k+1]:
             return 'not over'
     for j in range(len(mat)-1): #check up/down entries on last column
-        if mat[j][len(mat)-1]==mat[j+1][len(mat)-1]:
+        if mat[j][len(mat[0])-1]==mat[j+1][len(mat[0])-1]:
             return 'not over'
     return 'lose'
 
+# Incremental game-over tracking (used by Game)
+# board_masks returns (empty_mask, merge_lines): empty_mask has bit i*len(mat[0])+j set for every
+# empty cell, merge_lines has bit i set when row i can merge and bit len(mat)+j when column j can.
+# The game is lost when both are 0, which is exactly when game_state returns 'lose'.
+
+def line_can_merge(line):
+    previous=0
+    for value in line:
+        if value!=0:
+            if value==previous:
+                return True
+            previous=value
+    return False
+
+def column_can_merge(mat, j):
+    previous=0
+    for row in mat:
+        value=row[j]
+        if value!=0:
+            if value==previous:
+                return True
+            previous=value
+    return False
+
+def board_masks(mat):
+    # (empty_mask, merge_lines) in one pass over the cells, without building row or column lists
+    rows=len(mat)
+    empty=0
+    lines=0
+    above=[0]*len(mat[0])  # last tile seen in every column
+    cell=1
+    for i in range(rows):
+        left=0
+        j=0
+        for value in mat[i]:
+            if value==0:
+                empty|=cell
+            else:
+                if value==left:
+                    lines|=1<<i
+                if value==above[j]:
+                    lines|=1<<(rows+j)
+                left=value
+                above[j]=value
+            cell<<=1
+            j+=1
+    return empty, lines
+
+def update_merge_lines(mat, lines, i, j):
+    # only row i and column j can change when a single cell (i, j) changes
+    lines&=~((1<<i)|(1<<(len(mat)+j)))
+    if line_can_merge(mat[i]):
+        lines|=1<<i
+    if column_can_merge(mat, j):
+        lines|=1<<(len(mat)+j)
+    return lines
+
+def add_two_from_mask(mat, mask, rng=None, value=2):
+    # puts value on a uniformly chosen set bit of mask and returns (row, column) or None
+    if mask==0:
+        return None
+    count=bin(mask).count("1")
+    k=randrange(count) if rng is None else rng.randrange(count)
+    for _ in range(k):
+        mask&=mask-1
+    cell=(mask&-mask).bit_length()-1
+    a,b=divmod(cell,len(mat[0]))
+    mat[a][b]=value
+    return (a,b)
+
 ###########
 # Task 2a #
 ###########
@@ -119,7 +189,9 @@ def transpose(mat):
 # 2 per up/down/left/right?) But if you get one correct likely to get all correct so...
 # Check the down one. Reverse/transpose if ordered wrongly will give you wrong result.
 
-def cover_up(mat):
+# 4x4 boards, the default, take the unrolled-size versions; other sizes the general ones
+
+def cover_up_4x4(mat):
     new=[[0,0,0,0],[0,0,0,0],[0,0,0,0],[0,0,0,0]]
     done=False
     for i in range(4):
@@ -132,7 +204,7 @@ def cover_up(mat):
                 count+=1
     return (new,done)
 
-def merge(mat):
+def merge_4x4(mat):
     bonus_score = 0
     done=False
     for i in range(4):
@@ -144,6 +216,35 @@ def merge(mat):
                  done=True
     return (mat, done, bonus_score)
 
+def cover_up(mat):
+    if len(mat)==4 and len(mat[0])==4:
+        return cover_up_4x4(mat)
+    new=[[0]*len(mat[0]) for _ in range(len(mat))]
+    done=False
+    for i in range(len(mat)):
+        count=0
+        for j in range(len(mat[0])):
+            if mat[i][j]!=0:
+                new[i][count]=mat[i][j]
+                if j!=count:
+                    done=True
+                count+=1
+    return (new,done)
+
+def merge(mat):
+    if len(mat)==4 and len(mat[0])==4:
+        return merge_4x4(mat)
+    bonus_score = 0
+    done=False
+    for i in range(len(mat)):
+         for j in range(len(mat[0])-1):
+             if mat[i][j]==mat[i][j+1] and mat[i][j]!=0:
+                 mat[i][j]*=2
+                 bonus_score += mat[i][j]
+                 mat[i][j+1]=0
+                 done=True
+    return (mat, done, bonus_score)
+
 
 def up(game):
         # return matrix after shifting up
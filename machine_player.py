@@ -1,63 +1,138 @@
-from puzzle import *
-from threading import Thread
+from game import Game
+from game_history import create_history
+from renderers import NullRenderer, TerminalRenderer
+from threading import Thread, Event
 from multiprocessing import Process
 import time
+import queue
 import random
 import numpy as np
 import math
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import bitboard
+from search_state import SearchState
+from search_stats import SearchStats, SearchStatsCollector, InstrumentedSearchState, TimedEvaluator
+import batch_game
 
 
 # -------------------------------  Machine Players -------------------------------
 class VisualMachinePlayer(Thread):
-    def __init__(self, samples_directory_name, play_algorithm, play_interval=0.5):
-        super().__init__()
+    # Moves are computed and played on this thread, which then queues a copy of the board as a frame.
+    # GameGrid polls the queue from the Tk thread with after() and shows one frame at most fps times a
+    # second, so widgets are only touched by Tk. With skip_frames the queue holds one frame that every
+    # move replaces, so only the newest one is shown and the algorithm never waits for a redraw; without
+    # it every frame is shown and the player waits once 2 * fps frames are queued.
+    def __init__(self, samples_directory_name, play_algorithm, play_interval=0.5, board_size=4, fps=30,
+                 skip_frames=True):
+        super().__init__(daemon=True)
         self.samples_directory_name = samples_directory_name
+        self.board_size = board_size
         self.play_function = play_algorithm
         self.play_interval = play_interval
+        self.fps = fps
+        self.skip_frames = skip_frames
         self.visual_game = None
+        # (matrix, total score, game over) after every valid move
+        self.frames = queue.Queue(maxsize=1 if skip_frames else 2 * fps)
+        self.attached = Event()
+        self.resumed = Event()  # cleared while paused, the game starts paused
+        self.stopped = Event()
+
+    def attach(self, visual_game):
+        self.visual_game = visual_game
+        self.attached.set()
+
+    def set_paused(self, paused):
+        if paused:
+            self.resumed.clear()
+        else:
+            self.resumed.set()
+
+    def stop(self):
+        self.stopped.set()
+        self.resumed.set()
+
+    def put_frame(self, frame):
+        if self.skip_frames:
+            # this thread is the only producer, so once the old frame is taken out the slot is free
+            try:
+                self.frames.get_nowait()
+            except queue.Empty:
+                pass
+            self.frames.put_nowait(frame)
+            return
+        while not self.stopped.is_set():
+            try:
+                self.frames.put(frame, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def frame_interval(self):
+        # milliseconds between two polls of the frame queue
+        return max(int(1000 / self.fps), 1)
 
     def run(self):
         print("Player thread started")
-        while self.visual_game is None:
-            time.sleep(1)
-        while not self.visual_game.game.is_over():
-            if not self.visual_game.pause:
-                move = self.play_function(self.visual_game.game.matrix)
-                self.visual_game.move(move)
-                if self.play_interval > 0:
-                    time.sleep(self.play_interval)
-            else:
-                time.sleep(1)
+        self.attached.wait()
+        game = self.visual_game.game
+        while not game.is_over():
+            self.resumed.wait()
+            if self.stopped.is_set():
+                return
+            move = self.play_function(game.matrix)
+            if self.visual_game.play_move(move) != -1:
+                self.put_frame(([row[:] for row in game.matrix], game.true_score, game.is_over()))
+            if self.play_interval > 0 and self.stopped.wait(self.play_interval):
+                return
 
     def start_playing(self):
-        GameGrid(self)
+        from puzzle import GameGrid  # tkinter is only imported by the visual player
+        GameGrid(self, self.board_size)
 
 
 class BackgroundMachinePlayer:
 
-    def __init__(self, samples_directory_name, play_algorithm, finish_callback=None, game_id=-1, verbose=False):
+    def __init__(self, samples_directory_name, play_algorithm, finish_callback=None, game_id=-1, verbose=False,
+                 board_size=4, seed=None, search_stats=False, renderer=None, quiet=False):
         super().__init__()
         self.samples_directory_name = samples_directory_name
         self.play_function = play_algorithm
-        self.game = Game()
-        self.history = GameHistory()
+        # with search_stats the SearchStats of every decision are saved with its step; the algorithm has to
+        # take an instrumentation (the tree search players do)
+        self.search_stats = SearchStatsCollector() if search_stats else None
+        if self.search_stats is not None:
+            self.play_function.instrumentation = self.search_stats
+        self.game = Game(size=board_size, seed=seed)
+        self.renderer = renderer if renderer is not None else NullRenderer()  # see renderers.py
+        # no history is kept without a samples directory (e.g. for self-play training)
+        self.history = create_history(samples_directory_name, *self.game.size()) \
+            if samples_directory_name is not None else None
         self.finish_callback = finish_callback
         self.game_id = game_id
         self.play_time = 0
         self.verbose = verbose
-        if game_id != -1:
+        self.quiet = quiet  # no messages at all, not even when the game finishes
+        if game_id != -1 and not quiet:
             print("Game", game_id, "created and ready to be played")
 
     def run(self):
         start_time = time.time()
-        if self.game_id != -1:
+        if self.game_id != -1 and not self.quiet:
             print("Game", self.game_id, "started")
         while not self.game.is_over():
             matrix = self.game.matrix
+            decisions = len(self.search_stats) if self.search_stats is not None else 0
             move = self.play_function(self.game.matrix)
             bonus_score = self.game.move(move)
             if bonus_score != -1:
-                self.history.add_step(matrix, move, bonus_score, self.game.true_score)
+                stats = None
+                if self.search_stats is not None and len(self.search_stats) > decisions:
+                    stats = self.search_stats.decisions[-1].as_dict()
+                if self.history is not None:
+                    self.history.add_step(matrix, move, bonus_score, self.game.true_score, stats)
+                self.renderer.render(self.game.matrix, self.game.true_score)
                 if self.verbose:
                     print("Bonus:", bonus_score, "Total Score:", self.game.true_score)
             else:
@@ -66,14 +141,18 @@ class BackgroundMachinePlayer:
                     print("Move:", move)
                     print(self.game.matrix)
         self.play_time = time.time() - start_time
-        if self.game_id != -1:
+        self.renderer.game_over(self.game.true_score)
+        if self.quiet:
+            pass
+        elif self.game_id != -1:
             print("Game {} finished with {} moves and score {} and play time {}".format(self.game_id, self.game.total_moves, self.game.true_score, self.play_time))
         else:
             print("Game finished with {} moves and score {} and play time {}".format(self.game.total_moves, self.game.true_score, self.play_time))
-        self.history.total_moves = self.game.total_moves
-        self.history.invalid_moves = self.game.invalid_moves
-        self.history.total_score = self.game.true_score
-        self.history.dump_to_file("{}/{}.hxp".format(self.samples_directory_name, int(time.time())))
+        if self.history is not None:
+            self.history.total_moves = self.game.total_moves
+            self.history.invalid_moves = self.game.invalid_moves
+            self.history.total_score = self.game.true_score
+            self.history.close()
         if self.finish_callback is not None:
             self.finish_callback()
 
@@ -90,8 +169,12 @@ class BackgroundMachinePlayer:
 
 # ------------------------------- Machine Playing Algorithm -------------------------------
 class UniformRandomAlgorithm:
+    # draws from the global random module unless given a seed
+    def __init__(self, seed=None):
+        self.rng = None if seed is None else random.Random(seed)
+
     def __call__(self, *args, **kwargs):
-        return random.randint(0, 3)
+        return (self.rng or random).randint(0, 3)
 
 
 class DownLeftRightUpAlgorithm:
@@ -120,90 +203,471 @@ class DownLeftRightUpAlgorithm:
         return self.last_decision
 
 
-# ------------------------------- A Start Playing Algorithm -------------------------------
-class AStartAlgorithm:
+# ------------------------------- Parallel Root Search -------------------------------
+worker_pools = {}
+thread_pools = {}
+subtree_searchers = {}
 
-    def __init__(self):
+
+def get_worker_pool(workers):
+    # pools stay warm between moves and are shared by every algorithm asking for the same size
+    if workers not in worker_pools:
+        worker_pools[workers] = ProcessPoolExecutor(max_workers=workers)
+    return worker_pools[workers]
+
+
+def get_thread_pool(workers):
+    if workers not in thread_pools:
+        thread_pools[workers] = ThreadPoolExecutor(max_workers=workers)
+    return thread_pools[workers]
+
+
+def search_subtree_task(algorithm_class, evaluator, size, board, move, steps, seed, instrumented=False):
+    # instrumented tasks return (score, SearchStats of the subtree) for the caller to merge
+    if algorithm_class not in subtree_searchers:
+        subtree_searchers[algorithm_class] = algorithm_class()
+    searcher = subtree_searchers[algorithm_class]
+    searcher.evaluator = evaluator
+    searcher.current_stats = SearchStats() if instrumented else None
+    score = searcher.search_subtree(board, move, steps, seed, bitboard.kernel(*size))
+    return (score, searcher.current_stats) if instrumented else score
+
+
+# ------------------------------- Budgeted Tree Search -------------------------------
+class SearchTimeout(Exception):
+    pass
+
+
+class BudgetedTreeSearch:
+    # With a time_budget (seconds) or node_budget per move the search is deepened one level at a time,
+    # root moves are tried best-first according to the previous depth and the best move of the last
+    # completed depth is played when the budget runs out. The node budget counts legal moves applied,
+    # the nodes of SearchStats, over every depth of the decision. Without a budget subclasses search to a fixed
+    # depth as before.
+
+    def __init__(self, time_budget=None, node_budget=None, max_depth=16, workers=0, seed=None, evaluator=None,
+                 instrumentation=None, cache=None, cache_depth=3):
+        self.time_budget = time_budget
+        self.node_budget = node_budget
+        self.max_depth = max_depth
+        self.budget_active = False
+        self.deadline = None
+        self.nodes_left = 0
+        self.reached_depths = []  # search depth reached for every decision
+        self.workers = workers  # > 1 searches root moves in a persistent process pool (fixed depth only)
+        self.seed = seed
         self.call_count = 0
+        self.evaluator = evaluator  # leaf evaluation from heuristic.py, None scores leaves by merge bonus only
+        self.instrumentation = instrumentation  # called with the SearchStats of every decision, e.g. SearchStatsCollector
+        self.current_stats = None
+        self.cache = cache  # a position_cache.PositionCache shared by the games (and processes) using this player
+        self.cache_depth = cache_depth  # shallowest search read from or written to the cache
+        self.best_score = None  # score of the best move of the last completed search_root
 
     def __call__(self, matrix, *args, **kwargs):
-        self.call_count += 1
+        if self.instrumentation is None:
+            return self.cached_decide(matrix)
+        self.current_stats = SearchStats()
+        start_time = time.perf_counter()
+        try:
+            move = self.cached_decide(matrix)
+        finally:
+            stats = self.current_stats
+            stats.total_time = time.perf_counter() - start_time
+            self.current_stats = None
+        self.instrumentation(stats)
+        return move
+
+    def cached_decide(self, matrix):
+        # a 4x4 board found in the cache searched at least cache_depth deep is played without searching,
+        # any other board is searched and written back when the search went that deep
+        if self.cache is None or (len(matrix), len(matrix[0])) != (4, 4):
+            return self.decide(matrix)
+        board = bitboard.pack(matrix)
+        entry = self.cache.lookup(board, self.cache_depth)
+        if self.current_stats is not None:
+            self.current_stats.cache_lookups += 1
+            self.current_stats.cache_hits += entry is not None
+        if entry is not None:
+            return entry.move
+        start_time = time.perf_counter()
+        move = self.decide(matrix)
+        if self.reached_depths[-1] >= self.cache_depth:
+            self.cache.store(board, move, self.best_score, self.reached_depths[-1], time.perf_counter() - start_time)
+        return move
+
+    def decide(self, matrix):
+        raise NotImplementedError()
+
+    def has_budget(self):
+        return self.time_budget is not None or self.node_budget is not None
+
+    def check_budget(self, nodes=0):
+        # nodes: the legal moves applied (or about to be) since the last check
+        if self.node_budget is not None:
+            self.nodes_left -= nodes
+            if self.nodes_left < 0:
+                raise SearchTimeout()
+        if self.deadline is not None and time.time() > self.deadline:
+            raise SearchTimeout()
+
+    def deepen(self, matrix):
+        self.deadline = time.time() + self.time_budget if self.time_budget is not None else None
+        self.nodes_left = self.node_budget
+        self.budget_active = True
+        move_order = [0, 1, 2, 3]
+        best_move = -1
+        reached_depth = -1
+        try:
+            for steps in range(self.max_depth + 1):
+                best_move, scores = self.search_root(matrix, move_order, steps)
+                reached_depth = steps
+                if best_move == -1:
+                    break
+                move_order = sorted(scores, key=scores.get, reverse=True)
+        except SearchTimeout:
+            if self.current_stats is not None:
+                self.current_stats.budget_exhausted = True
+        finally:
+            self.budget_active = False
+        if reached_depth == -1:
+            # not even the shallowest search finished, finish it without a budget
+            best_move = self.search_root(matrix, move_order, 0)[0]
+            reached_depth = 0
+        self.reached_depths.append(reached_depth)
+        return best_move
+
+    def search_root(self, matrix, move_order, steps):
+        kernel = bitboard.kernel_for(matrix)
+        board = kernel.pack(matrix)
+        if self.workers > 1 and not self.budget_active:
+            # root moves are independent, hand the packed board to the warm pool one task per move
+            pool = get_worker_pool(self.workers)
+            instrumented = self.current_stats is not None
+            futures = [(move, pool.submit(search_subtree_task, type(self), self.evaluator,
+                                               (kernel.rows, kernel.cols), board, move, steps, self.subtree_seed(move),
+                                               instrumented))
+                       for move in move_order]
+            results = [(move, future.result()) for move, future in futures]
+            if instrumented:
+                for _, (_, stats) in results:
+                    self.current_stats.merge(stats)
+                results = [(move, score) for move, (score, _) in results]
+        else:
+            results = [(move, self.search_subtree(board, move, steps, self.subtree_seed(move), kernel))
+                       for move in move_order]
         best_move = -1
         best_score = -1
-        look_forward_steps = int(np.count_nonzero(matrix) / 4) + 3
-        # look_forward_steps = 3 + int(math.log10(self.call_count))
-        for move in range(4):
-            g = Game(matrix).clone()
-            bonus = g.move(move)
-            if bonus == -1:
+        scores = {}
+        for move, score in results:
+            if score is None:
                 continue
-            predicted = self.predict_score(g.matrix, look_forward_steps)
-            if bonus + predicted > best_score:
-                best_score = bonus + predicted
+            scores[move] = score
+            if best_move == -1 or score > best_score:
+                best_score = score
                 best_move = move
-        return best_move
+        self.best_score = best_score
+        return best_move, scores
 
-    def predict_score(self, matrix, steps_to_go):
-        if Game(matrix).is_over():
-            return 0
-        scores = []
-        for move in range(4):
-            g = Game(matrix).clone()
-            bonus = g.move(move)
+    def subtree_seed(self, move):
+        # with a seed every root subtree draws its spawns from its own stream, so serial and
+        # parallel searches of the same board pick the same move
+        if self.seed is not None:
+            return (self.seed * 1000003 + self.call_count) * 4 + move
+        if self.workers > 1:
+            # forked workers share one random state, give every task its own
+            return random.getrandbits(64)
+        return None
+
+    def search_subtree(self, board, move, steps, seed=None, kernel=None):
+        # the whole subtree is searched on one SearchState with apply/undo, spawning from its own
+        # random.Random(seed) when seeded instead of reseeding the global random module
+        rng = random if seed is None else random.Random(seed)
+        if self.current_stats is not None:
+            return self.search_instrumented_subtree(board, move, steps, rng, kernel)
+        state = SearchState(board, rng, kernel)
+        bonus = state.apply(move)
+        if bonus == -1:
+            return None
+        if self.budget_active:
+            self.check_budget(1)
+        return bonus + self.predict_score(state, steps)
+
+    def search_instrumented_subtree(self, board, move, steps, rng, kernel):
+        # same search, counted and timed into current_stats
+        state = InstrumentedSearchState(board, rng, kernel, self.current_stats)
+        evaluator = self.evaluator
+        if evaluator is not None:
+            self.evaluator = TimedEvaluator(evaluator, self.current_stats)
+        try:
+            bonus = state.apply(move)
             if bonus == -1:
-                continue
-            if g.is_over() or steps_to_go == 0:
-                scores.append(g.move(move))
+                return None
+            if self.budget_active:
+                self.check_budget(1)
+            return bonus + self.predict_score(state, steps)
+        finally:
+            self.evaluator = evaluator
+
+    def predict_score(self, state, steps_to_go):
+        raise NotImplementedError()
+
+
+# ------------------------------- A Start Playing Algorithm -------------------------------
+class AStartAlgorithm(BudgetedTreeSearch):
+
+    def __init__(self, time_budget=None, node_budget=None, max_depth=16, workers=0, seed=None, evaluator=None,
+                 instrumentation=None, cache=None, cache_depth=3):
+        super().__init__(time_budget, node_budget, max_depth, workers, seed, evaluator, instrumentation, cache,
+                         cache_depth)
+
+    def decide(self, matrix):
+        self.call_count += 1
+        if self.has_budget():
+            return self.deepen(matrix)
+        look_forward_steps = int(np.count_nonzero(matrix) / 4) + 3
+        # look_forward_steps = 3 + int(math.log10(self.call_count))
+        self.reached_depths.append(look_forward_steps)
+        return self.search_root(matrix, range(4), look_forward_steps)[0]
+
+    def predict_score(self, state, steps_to_go):
+        if state.is_over():
+            return 0 if self.evaluator is None else self.evaluator.lost_value
+        scores = []
+        boards, bonuses, legal = state.afterstates()
+        moves = bitboard.legal_moves(legal)
+        if self.budget_active:
+            self.check_budget(len(moves))
+        leaf_nodes = 0
+        for move in moves:
+            bonus = state.apply_afterstate(boards[move], bonuses[move])
+            over = state.is_over()
+            if self.evaluator is not None and (over or steps_to_go == 0):
+                scores.append(bonus + (self.evaluator.lost_value if over else self.evaluator(state.board)))
+            elif over or steps_to_go == 0:
+                scores.append(state.apply(move))
+                leaf_nodes += scores[-1] != -1
+                state.undo()
             else:
-                scores.append(bonus + self.predict_score(g.matrix, steps_to_go-1))
+                scores.append(bonus + self.predict_score(state, steps_to_go-1))
+            state.undo()
+        if leaf_nodes and self.budget_active:
+            self.check_budget(leaf_nodes)
         return max(scores) if len(scores) > 0 else 0
 
 
 # ------------------------------- A Start Playing Algorithm -------------------------------
-class TDTreeSearchAlgorithm:
+class TDTreeSearchAlgorithm(BudgetedTreeSearch):
 
-    def __init__(self, incremental_call_count=True):
-        self.call_count = 0
+    def __init__(self, incremental_call_count=True, time_budget=None, node_budget=None, max_depth=16, workers=0,
+                 seed=None, evaluator=None, instrumentation=None, cache=None, cache_depth=3):
+        super().__init__(time_budget, node_budget, max_depth, workers, seed, evaluator, instrumentation, cache,
+                         cache_depth)
         self.incremental_call_count = incremental_call_count
 
-    def __call__(self, matrix, *args, **kwargs):
+    def decide(self, matrix):
         if self.incremental_call_count:
             self.call_count += 1
+        if self.has_budget():
+            return self.deepen(matrix)
+        if self.incremental_call_count:
+            look_forward_steps = 3 + int(math.log10(self.call_count))
+        else:
+            look_forward_steps = 3
+        self.reached_depths.append(look_forward_steps)
+        return self.search_root(matrix, range(4), look_forward_steps)[0]
+
+    def predict_score(self, state, steps_to_go):
+        if state.is_over():
+            return 0 if self.evaluator is None else self.evaluator.lost_value
+        scores = []
+        boards, bonuses, legal = state.afterstates()
+        moves = bitboard.legal_moves(legal)  # illegal moves are skipped
+        if self.budget_active:
+            self.check_budget(len(moves))
+        for move in moves:
+            bonus = state.apply_afterstate(boards[move], bonuses[move])
+            over = state.is_over()
+            if self.evaluator is not None and (over or steps_to_go == 0):
+                scores.append(bonus + (self.evaluator.lost_value if over else self.evaluator(state.board)))
+            elif over or steps_to_go == 0:  # Game is over ever taking a move or we have reached our max dept
+                scores.append(bonus)
+            else:
+                scores.append(bonus + self.predict_score(state, steps_to_go-1))
+            state.undo()
+        return sum(scores) / len(scores)
+
+
+# ------------------------------- Monte Carlo Playing Algorithm -------------------------------
+class MonteCarloAlgorithm:
+    # Every legal root move is scored by the mean final score of `rollouts` uniformly random playouts
+    # from the board it leads to, run to game over or max_moves moves. The playouts of all root moves
+    # are played together as one batch_game batch; with workers > 1 the batch is split into that many
+    # chunks run on a thread pool or, with use_processes, the shared process pool. 4x4 boards only.
+
+    def __init__(self, rollouts=100, max_moves=None, workers=0, use_processes=False, seed=None, verbose=False):
+        self.rollouts = rollouts
+        self.max_moves = max_moves
+        self.workers = workers
+        self.use_processes = use_processes
+        self.rng = None if seed is None else np.random.default_rng(seed)  # np.random unless seeded
+        self.verbose = verbose
+        self.playouts = 0
+        self.rollout_time = 0.0
+
+    def __call__(self, matrix, *args, **kwargs):
+        boards = batch_game.to_exponents([matrix] * 4)
+        after, legal, bonus = batch_game.slide(boards, np.arange(4))
+        moves = np.flatnonzero(legal)
+        if len(moves) == 0:
+            return -1
+        start_time = time.time()
+        scores = self.rollout(np.repeat(after[moves], self.rollouts, axis=0))
+        self.rollout_time += time.time() - start_time
+        self.playouts += len(scores)
+        means = bonus[moves] + scores.reshape(len(moves), self.rollouts).mean(axis=1)
+        if self.verbose:
+            print("Move scores:", dict(zip(moves.tolist(), means.round(1).tolist())),
+                  "Playouts/sec: {:.0f}".format(self.playouts_per_second()))
+        return int(moves[np.argmax(means)])
+
+    def rollout_seeds(self, count):
+        if self.rng is None:
+            return np.random.randint(0, 2 ** 31, size=count).tolist()
+        return self.rng.integers(0, 2 ** 63, size=count).tolist()
+
+    def rollout(self, boards):
+        if self.workers <= 1:
+            return batch_game.rollout_scores(boards, self.max_moves, self.rollout_seeds(1)[0])
+        pool = get_worker_pool(self.workers) if self.use_processes else get_thread_pool(self.workers)
+        chunks = np.array_split(boards, self.workers)
+        futures = [pool.submit(batch_game.rollout_scores, chunk, self.max_moves, seed)
+                   for chunk, seed in zip(chunks, self.rollout_seeds(len(chunks)))]
+        return np.concatenate([future.result() for future in futures])
+
+    def playouts_per_second(self):
+        return self.playouts / self.rollout_time if self.rollout_time > 0 else 0.0
+
+
+# ------------------------------- Expectimax Playing Algorithm -------------------------------
+class ExpectimaxAlgorithm:
+
+    def __init__(self, depth=3, probability_cutoff=0.0001, cache_size=200000, canonical=False, evaluator=None,
+                 verbose=False, instrumentation=None):
+        self.depth = depth
+        self.probability_cutoff = probability_cutoff
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # (board << 4 | depth) -> value, kept in LRU order
+        self.canonical = canonical  # key the cache on the symmetry-canonical board (4x4 only)
+        self.kernel = bitboard.kernel(4)
+        self.evaluator = evaluator  # leaf evaluation from heuristic.py, None scores leaves by merge bonus only
+        self.verbose = verbose
+        self.instrumentation = instrumentation  # called with the SearchStats of every decision, e.g. SearchStatsCollector
+        self.call_count = 0
+        self.nodes = 0
+        self.cache_hits = 0
+        self.cache_lookups = 0
+        self.cutoffs = 0
+        self.illegal_moves = 0
+        self.stats = []  # (nodes, cache_hits, cache_lookups) for every decision
+
+    def __call__(self, matrix, *args, **kwargs):
+        start_time = time.perf_counter()
+        self.call_count += 1
+        self.nodes = 0
+        self.cache_hits = 0
+        self.cache_lookups = 0
+        self.cutoffs = 0
+        self.illegal_moves = 0
+        self.kernel = bitboard.kernel_for(matrix)
+        board = self.kernel.pack(matrix)
         best_move = -1
         best_score = -1
         for move in range(4):
-            g = Game(matrix).clone()
-            bonus = g.move(move)
-            if bonus == -1:
+            after, done, bonus = self.kernel.moves[move](board)
+            if not done:
                 continue
-            if self.incremental_call_count:
-                predicted = self.predict_score(g.matrix, 3 + int(math.log10(self.call_count)))
-            else:
-                predicted = self.predict_score(g.matrix, 3)
-            if bonus + predicted > best_score:
+            predicted = self.chance_node(after, self.depth - 1, 1.0)
+            if best_move == -1 or bonus + predicted > best_score:
                 best_score = bonus + predicted
                 best_move = move
+        self.stats.append((self.nodes, self.cache_hits, self.cache_lookups))
+        if self.instrumentation is not None:
+            self.report(time.perf_counter() - start_time)
+        if self.verbose:
+            print("Move:", best_move, "Nodes:", self.nodes, "Cache hit rate: {:.3f}".format(self.last_hit_rate()))
         return best_move
 
-    def predict_score(self, matrix, steps_to_go):
-        game = Game(matrix)
-        if game.is_over():
-            return game.score
-        scores = []
+    def report(self, total_time):
+        # only counts and the total time, the search itself isn't timed by phase
+        stats = SearchStats()
+        stats.nodes = self.nodes
+        stats.max_depth = self.depth  # nodes counts chance and max nodes rather than moves applied
+        stats.illegal_moves = self.illegal_moves
+        stats.pruned = self.cutoffs
+        stats.cache_hits = self.cache_hits
+        stats.cache_lookups = self.cache_lookups
+        stats.total_time = total_time
+        self.instrumentation(stats)
+
+    def last_hit_rate(self):
+        return self.cache_hits / self.cache_lookups if self.cache_lookups > 0 else 0.0
+
+    def chance_node(self, board, steps_to_go, probability):
+        # the random tile is spawned after our move, average over every empty cell
+        if steps_to_go == 0 or probability < self.probability_cutoff:
+            if steps_to_go > 0:
+                self.cutoffs += 1
+            return 0 if self.evaluator is None else self.evaluator(board)
+        if self.canonical and (self.kernel.rows, self.kernel.cols) == (4, 4):
+            key = bitboard.canonical(board)[0] << 4 | steps_to_go
+        else:
+            key = board << 4 | steps_to_go
+        self.cache_lookups += 1
+        if key in self.cache:
+            self.cache_hits += 1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        self.nodes += 1
+        empty_cells = [shift for shift in range(0, 4 * self.kernel.cells, 4) if not board >> shift & 0xF]
+        cell_probability = 1.0 / len(empty_cells)
+        value = 0.0
+        for shift in empty_cells:
+            value += self.max_node(board | 1 << shift, steps_to_go, probability * cell_probability)
+        value *= cell_probability
+        self.cache[key] = value
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return value
+
+    def max_node(self, board, steps_to_go, probability):
+        self.nodes += 1
+        best = None
+        boards, bonuses, legal = self.kernel.afterstates(board)
         for move in range(4):
-            g = game.clone()
-            bonus = g.move(move)
-            if bonus == -1:  # Illegal move
+            if not legal >> move & 1:
+                self.illegal_moves += 1
                 continue
-            if g.is_over() or steps_to_go == 0:  # Game is over ever taking a move or we have reached our max dept
-                scores.append(bonus)
-            else:
-                scores.append(bonus + self.predict_score(g.matrix, steps_to_go-1))
-        return np.array(scores).mean()
+            value = bonuses[move] + self.chance_node(boards[move], steps_to_go - 1, probability)
+            if best is None or value > best:
+                best = value
+        if best is None:
+            return 0 if self.evaluator is None else self.evaluator.lost_value
+        return best
 
 
 if __name__ == "__main__":
-    player = VisualMachinePlayer("machine_played_samples", AStartAlgorithm(), play_interval=0.0)
-    player.start_playing()
+    import argparse
+    parser = argparse.ArgumentParser(description="Watch AStartAlgorithm play")
+    parser.add_argument("-r", "--renderer", choices=["tk", "terminal", "none"], default="tk",
+                        help="tk plays in the pausable GameGrid window, terminal and none need no display")
+    args = parser.parse_args()
+    if args.renderer == "tk":
+        player = VisualMachinePlayer("machine_played_samples", AStartAlgorithm(), play_interval=0.0)
+        player.start_playing()
+    else:
+        player = BackgroundMachinePlayer("machine_played_samples", AStartAlgorithm(),
+                                         renderer=TerminalRenderer() if args.renderer == "terminal" else None)
+        player.run()
     # player = BackgroundMachinePlayer("dlru_player_samples", TDTreeSearchAlgorithm())
     # player.start_playing_as_process()
@@ -0,0 +1,221 @@
+import json
+import os
+import time
+import numpy as np
+import bitboard
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from machine_player import BackgroundMachinePlayer
+
+#
+# N-tuple network value function trained by TD(0) afterstate learning
+#
+# An n-tuple is a fixed set of cells; the exponents in those cells, read as one packed nibble pattern,
+# index a table of weights. The value of a board is the sum of the weights of every tuple over all 8
+# symmetries of the board. All tables live in one flat float32 array (offsets[k] is where tuple k's
+# table starts), so a checkpoint is a single .npy file that can be memory-mapped; its tuples are kept
+# in a .json file next to it.
+#
+# The player (NTupleAlgorithm) moves greedily on reward + value of the afterstate, the board after the
+# move and before the random tile. While learning it moves the value of its previous afterstate towards
+# the reward and afterstate value of the move it just chose, and towards 0 once the game is over.
+#
+
+# cells are numbered row by row, cell c being the nibble at bit 4 * c of a packed board
+DEFAULT_TUPLES = (
+    (0, 1, 2, 3, 4, 5),
+    (4, 5, 6, 7, 8, 9),
+    (0, 1, 2, 4, 5, 6),
+    (4, 5, 6, 8, 9, 10),
+)
+
+
+def tuple_extractor(cells):
+    # (shift, mask) terms that gather the cells' nibbles into a dense pattern, one term per run of
+    # consecutive cells: pattern = OR of (board >> shift) & mask
+    terms = []
+    position = 0
+    previous = None
+    for cell in sorted(cells):
+        if terms and cell == previous + 1:
+            shift, mask = terms[-1]
+            terms[-1] = (shift, mask | 0xF << 4 * position)
+        else:
+            terms.append((4 * (cell - position), 0xF << 4 * position))
+        previous = cell
+        position += 1
+    return terms
+
+
+def meta_path(path):
+    return os.path.splitext(path)[0] + ".json"
+
+
+class NTupleNetwork:
+
+    def __init__(self, tuples=DEFAULT_TUPLES, weights=None, path=None):
+        self.tuples = [tuple(sorted(cells)) for cells in tuples]
+        self.offsets = []
+        size = 0
+        for cells in self.tuples:
+            self.offsets.append(size)
+            size += 16 ** len(cells)
+        self.extractors = [(offset, tuple_extractor(cells)) for offset, cells in zip(self.offsets, self.tuples)]
+        self.array_extractors = [(offset, [(np.uint64(shift), np.uint64(mask)) for shift, mask in terms])
+                                 for offset, terms in self.extractors]
+        self.weights = weights if weights is not None else np.zeros(size, dtype=np.float32)
+        self.path = path
+        self.lookups = 8 * len(self.tuples)  # weights read per board
+
+    @classmethod
+    def create(cls, path, tuples=DEFAULT_TUPLES):
+        # a new all-zero checkpoint, memory-mapped read/write
+        network = cls(tuples, weights=np.zeros(0, dtype=np.float32))
+        weights = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32,
+                                            shape=(network.offsets[-1] + 16 ** len(network.tuples[-1]),))
+        network = cls(tuples, weights, path)
+        network.save_meta({"games": 0})
+        return network
+
+    @classmethod
+    def load(cls, path, mode="r"):
+        # mode "r" for playing, "r+" to keep training the file in place (shared by every process using it)
+        with open(meta_path(path)) as file:
+            meta = json.load(file)
+        return cls(meta["tuples"], np.load(path, mmap_mode=mode), path)
+
+    def save(self, path, games=0):
+        np.save(path, np.asarray(self.weights))
+        self.path = path
+        self.save_meta({"games": games})
+
+    def save_meta(self, meta):
+        with open(meta_path(self.path), "w") as file:
+            json.dump(dict(meta, tuples=self.tuples), file)
+
+    def meta(self):
+        with open(meta_path(self.path)) as file:
+            return json.load(file)
+
+    def flush(self):
+        if isinstance(self.weights, np.memmap):
+            self.weights.flush()
+
+    def indices(self, board):
+        # weight indices of every tuple over the 8 symmetries of a packed 4x4 board
+        return [offset + sum((symmetric >> shift) & mask for shift, mask in terms)
+                for symmetric in bitboard.symmetries(board) for offset, terms in self.extractors]
+
+    def value(self, board):
+        return float(self.weights[self.indices(board)].sum())
+
+    def values(self, boards):
+        # values of several boards at once, the patterns of all their symmetries extracted as uint64 arrays
+        symmetric = np.array([bitboard.symmetries(board) for board in boards], dtype=np.uint64)
+        indices = np.stack([offset + sum((symmetric >> shift) & mask for shift, mask in terms)
+                            for offset, terms in self.array_extractors], axis=-1).astype(np.intp)
+        return self.weights[indices].reshape(len(boards), self.lookups).sum(axis=1)
+
+    def update(self, indices, delta):
+        # delta is spread over the weights of the board; repeated indices (symmetric boards) add up
+        np.add.at(self.weights, indices, np.float32(delta / self.lookups))
+
+
+class NTupleAlgorithm:
+    # 1-ply greedy player on an NTupleNetwork; with learning_rate it learns from the games it plays
+    # and end_game() has to be called after each one (BackgroundMachinePlayer's finish_callback)
+
+    def __init__(self, network, learning_rate=None):
+        self.network = network
+        self.learning_rate = learning_rate
+        self.previous = None  # weight indices of the last afterstate while learning
+
+    def choose(self, board):
+        # (move, reward, afterstate) of the best move, move -1 when there is none
+        boards, bonuses, legal = bitboard.afterstates(board)
+        moves = [(move, bonuses[move], boards[move]) for move in bitboard.legal_moves(legal)]
+        if not moves:
+            return -1, 0, None
+        values = self.network.values([after for _, _, after in moves])
+        best = int(np.argmax([bonus_score + value for (_, bonus_score, _), value in zip(moves, values)]))
+        return moves[best]
+
+    def __call__(self, matrix, *args, **kwargs):
+        move, reward, after = self.choose(bitboard.pack(matrix))
+        if self.learning_rate is not None and after is not None:
+            indices = self.network.indices(after)
+            if self.previous is not None:
+                target = reward + self.network.weights[indices].sum()
+                self.learn(target)
+            self.previous = indices
+        return move
+
+    def learn(self, target):
+        error = target - self.network.weights[self.previous].sum()
+        self.network.update(self.previous, self.learning_rate * error)
+
+    def end_game(self):
+        if self.learning_rate is not None and self.previous is not None:
+            self.learn(0.0)
+        self.previous = None
+
+
+# ------------------------------- Self-play training -------------------------------
+def train_games(path, games, learning_rate, seed):
+    # plays and learns from `games` self-play games on the checkpoint at path, updated in place
+    # (lock-free when several processes train the same file); returns the final scores
+    network = NTupleNetwork.load(path, mode="r+")
+    algorithm = NTupleAlgorithm(network, learning_rate)
+    scores = []
+    for i in range(games):
+        player = BackgroundMachinePlayer(None, algorithm, finish_callback=algorithm.end_game, seed=seed + i,
+                                         quiet=True)
+        player.run()
+        scores.append(player.game.true_score)
+    network.flush()
+    return scores
+
+
+def train(path, games, workers=1, learning_rate=0.1, block_size=100, seed=0, tuples=DEFAULT_TUPLES):
+    # trains the checkpoint at path (created when missing) in blocks of block_size games and returns the
+    # learning curve: (games trained, mean score of the block, games/sec) for every block
+    if not os.path.exists(path):
+        NTupleNetwork.create(path, tuples)
+    trained = NTupleNetwork.load(path).meta()["games"]
+    blocks = [(seed * 1000003 + start, min(block_size, games - start)) for start in range(0, games, block_size)]
+    curve = []
+    played = 0
+    start_time = time.time()
+    if workers <= 1:
+        results = (train_games(path, count, learning_rate, block_seed) for block_seed, count in blocks)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        futures = [pool.submit(train_games, path, count, learning_rate, block_seed) for block_seed, count in blocks]
+        results = (future.result() for future in as_completed(futures))
+    for scores in results:
+        trained += len(scores)
+        played += len(scores)
+        curve.append((trained, float(np.mean(scores)), played / (time.time() - start_time)))
+        print("games {}: mean score {:.0f}, {:.1f} games/sec".format(*curve[-1]))
+    if workers > 1:
+        pool.shutdown()
+    network = NTupleNetwork.load(path)
+    network.save_meta(dict(network.meta(), games=trained))
+    return curve
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="TD(0) self-play training of an n-tuple network")
+    parser.add_argument("checkpoint", help=".npy weight file, created when missing")
+    parser.add_argument("-n", "--games", type=int, default=1000)
+    parser.add_argument("-w", "--workers", type=int, default=1)
+    parser.add_argument("-a", "--learning-rate", type=float, default=0.1)
+    parser.add_argument("-b", "--block-size", type=int, default=100)
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("-c", "--curve", help="write the learning curve to this JSON file")
+    args = parser.parse_args()
+    curve = train(args.checkpoint, args.games, args.workers, args.learning_rate, args.block_size, args.seed)
+    if args.curve:
+        with open(args.curve, "w") as file:
+            json.dump([{"games": games, "mean_score": score, "games_per_sec": rate} for games, score, rate in curve],
+                      file, indent=2)
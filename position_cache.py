@@ -0,0 +1,187 @@
+import mmap
+import os
+import struct
+import bitboard
+
+#
+# Persistent best-move cache for the search players
+#
+# A fixed-size hash file of search results, one slot per 4x4 board: the move the search chose, the
+# score it gave that move, the depth it searched and the seconds the search took. The file is
+# memory-mapped, so it survives the game and every process opening it (e.g. the tournament or
+# self-play workers) reads and writes the same table without copying it.
+#
+# A board hashes to a bucket of BUCKET slots. A result is written over the entry of the same board if
+# it is at least as deep, else into an empty slot of the bucket, else over the shallowest entry of the
+# bucket if that one is not deeper (depth-preferred eviction): the file never grows past its slot
+# count. Writers don't lock; a slot stores its key xor'ed with its data words, so a slot torn by two
+# concurrent writes no longer matches its board and is read as a miss.
+#
+# Entries are only meaningful to the player configuration that wrote them, keep one file per
+# algorithm and evaluator. With canonical=True the 8 symmetries of a board share one entry.
+#
+
+MAGIC = b"PCH1"
+VERSION = 1
+HEADER = struct.Struct("<4sBBxxQ")  # magic, version, canonical, slot count
+SLOT = struct.Struct("<QQQ")  # key ^ value ^ meta, value (float64 bits), meta
+VALUE = struct.Struct("<d")
+SECONDS = struct.Struct("<f")
+BUCKET = 4
+
+
+def hash_board(board):
+    # 64-bit mix (splitmix64 finalizer) so nearby boards land in different buckets
+    board = (board ^ (board >> 30)) * 0xBF58476D1CE4E5B9 & 0xFFFFFFFFFFFFFFFF
+    board = (board ^ (board >> 27)) * 0x94D049BB133111EB & 0xFFFFFFFFFFFFFFFF
+    return board ^ (board >> 31)
+
+
+def pack_meta(move, depth, seconds):
+    # seconds (float32 bits) << 32 | depth << 8 | move
+    return struct.unpack("<I", SECONDS.pack(seconds))[0] << 32 | min(depth, 0xFFFF) << 8 | move
+
+
+def meta_depth(meta):
+    return meta >> 8 & 0xFFFF
+
+
+class CacheEntry:
+    __slots__ = ("move", "value", "depth", "seconds")
+
+    def __init__(self, move, value, depth, seconds):
+        self.move = move
+        self.value = value
+        self.depth = depth
+        self.seconds = seconds  # what the search that found it took
+
+
+class PositionCache:
+
+    def __init__(self, path, slots=1 << 20, canonical=True, readonly=False):
+        # opens the cache file at path, creating it with `slots` slots (24 bytes each) when missing;
+        # an existing file keeps its own slot count and canonical setting
+        if not os.path.exists(path) and not readonly:
+            slots = max(BUCKET, slots // BUCKET * BUCKET)
+            with open(path, "wb") as file:
+                file.write(HEADER.pack(MAGIC, VERSION, int(canonical), slots))
+                file.truncate(HEADER.size + slots * SLOT.size)
+        self.path = path
+        self.file = open(path, "rb" if readonly else "r+b")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ if readonly else mmap.ACCESS_WRITE)
+        magic, version, canonical, slots = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not a position cache".format(path))
+        self.canonical = bool(canonical)
+        self.slots = slots
+        self.buckets = slots // BUCKET
+        self.readonly = readonly
+        self.lookups = 0
+        self.hits = 0
+        self.stores = 0
+        self.evictions = 0
+        self.saved_time = 0.0  # search seconds of the entries hit
+
+    def key(self, board):
+        # (key, transform): the board is stored under key + 1 so an all-zero slot is empty
+        if self.canonical:
+            board, transform = bitboard.canonical(board)
+            return board + 1, transform
+        return board + 1, 0
+
+    def bucket(self, key):
+        start = HEADER.size + (hash_board(key) % self.buckets) * BUCKET * SLOT.size
+        return range(start, start + BUCKET * SLOT.size, SLOT.size)
+
+    def read_slot(self, offset):
+        # (key, value, meta) of a slot: key 0 when it is empty, some other board than written when torn
+        check, value, meta = SLOT.unpack_from(self.map, offset)
+        return check ^ value ^ meta, value, meta
+
+    def lookup(self, board, min_depth=0):
+        # the CacheEntry of the board searched at least min_depth deep, None otherwise
+        self.lookups += 1
+        key, transform = self.key(board)
+        for offset in self.bucket(key):
+            slot_key, value, meta = self.read_slot(offset)
+            if slot_key != key:
+                continue
+            if meta_depth(meta) < min_depth:
+                return None
+            entry = CacheEntry(bitboard.inverse_transform_move(meta & 0xFF, transform),
+                               VALUE.unpack(struct.pack("<Q", value))[0], meta_depth(meta),
+                               SECONDS.unpack(struct.pack("<I", meta >> 32))[0])
+            self.hits += 1
+            self.saved_time += entry.seconds
+            return entry
+        return None
+
+    def store(self, board, move, value, depth, seconds=0.0):
+        if self.readonly or move < 0:
+            return False
+        key, transform = self.key(board)
+        meta = pack_meta(bitboard.transform_move(move, transform), depth, seconds)
+        value = struct.unpack("<Q", VALUE.pack(value))[0]
+        existing = empty = shallowest = None
+        for offset in self.bucket(key):
+            slot_key, _, slot_meta = self.read_slot(offset)
+            if slot_key == key:
+                existing = offset, meta_depth(slot_meta)
+                break
+            if slot_key == 0:
+                if empty is None:
+                    empty = offset
+            elif shallowest is None or meta_depth(slot_meta) < shallowest[1]:
+                shallowest = offset, meta_depth(slot_meta)
+        if existing is not None:
+            if existing[1] > depth:
+                return False
+            target = existing[0]
+        elif empty is not None:
+            target = empty
+        elif shallowest[1] <= depth:
+            target = shallowest[0]
+            self.evictions += 1
+        else:
+            return False  # every entry of the bucket is deeper
+        SLOT.pack_into(self.map, target, key ^ value ^ meta, value, meta)
+        self.stores += 1
+        return True
+
+    def __len__(self):
+        # occupied slots, a full scan of the file
+        return sum(1 for offset in range(HEADER.size, HEADER.size + self.slots * SLOT.size, SLOT.size)
+                   if self.read_slot(offset)[0] != 0)
+
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def report(self):
+        return {
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": self.hit_rate(),
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "saved_time": self.saved_time,
+        }
+
+    def reset_stats(self):
+        self.lookups = self.hits = self.stores = self.evictions = 0
+        self.saved_time = 0.0
+
+    def flush(self):
+        if not self.readonly:
+            self.map.flush()
+
+    def close(self):
+        self.flush()
+        self.map.close()
+        self.file.close()
+
+    # a cache handed to a worker process is reopened there on the same file
+    def __getstate__(self):
+        return {"path": self.path, "readonly": self.readonly}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], readonly=state["readonly"])
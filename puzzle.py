@@ -2,21 +2,11 @@ from tkinter import *
 from game_history import *
 from random import *
 from game import *
+from renderers import *
 import os
+import queue
 
-SIZE = 500
 GRID_LEN = 4
-GRID_PADDING = 10
-
-BACKGROUND_COLOR_GAME = "#92877d"
-BACKGROUND_COLOR_CELL_EMPTY = "#9e948a"
-BACKGROUND_COLOR_DICT = {2: "#eee4da", 4: "#ede0c8", 8: "#f2b179", 16: "#f59563", \
-                         32: "#f67c5f", 64: "#f65e3b", 128: "#edcf72", 256: "#edcc61", \
-                         512: "#edc850", 1024: "#edc53f", 2048: "#edc22e"}
-CELL_COLOR_DICT = {2: "#776e65", 4: "#776e65", 8: "#f9f6f2", 16: "#f9f6f2", \
-                   32: "#f9f6f2", 64: "#f9f6f2", 128: "#f9f6f2", 256: "#f9f6f2", \
-                   512: "#f9f6f2", 1024: "#f9f6f2", 2048: "#f9f6f2"}
-FONT = ("Verdana", 40, "bold")
 
 KEY_UP_ALT = "\'\\uf700\'"
 KEY_DOWN_ALT = "\'\\uf701\'"
@@ -30,7 +20,9 @@ KEY_RIGHT = "'d'"
 
 
 class GameGrid(Frame):
-    def __init__(self, machine_player_object=None):
+    # start=False builds the window without entering the Tk main loop (e.g. for benchmark.py render).
+    # grid_len is the side of a square board or a (rows, cols) pair, like Game's size
+    def __init__(self, machine_player_object=None, grid_len=GRID_LEN, start=True):
         Frame.__init__(self)
 
         self.grid()
@@ -41,19 +33,30 @@ class GameGrid(Frame):
                          KEY_UP_ALT: 0, KEY_DOWN_ALT: 1, KEY_LEFT_ALT: 2, KEY_RIGHT_ALT: 3}
         self.pause = True
         self.machine_player_object = machine_player_object
-        if self.is_machine_playing():
-            self.machine_player_object.start()
+        self.grid_len = grid_len
+        self.rows, self.cols = grid_len if isinstance(grid_len, tuple) else (grid_len, grid_len)
         self.grid_cells = []
+        self.rendered = None  # the board the labels show, only cells that differ from it are reconfigured
         self.init_grid()
-        self.game = Game()
-        self.history = GameHistory()
+        self.game = Game(size=grid_len)
+        if self.is_machine_playing():
+            self.history = create_history(self.machine_player_object.samples_directory_name, *self.game.size())
+        else:
+            self.history = create_history("human_played_samples", *self.game.size())
 
         # self.init_matrix()
         self.update_grid_cells()
 
+        if not start:
+            return
         if self.is_machine_playing():
-            self.machine_player_object.visual_game = self
+            # the player thread plays on self.game and queues frames, poll_frames shows them on this thread
+            self.machine_player_object.attach(self)
+            self.machine_player_object.start()
+            self.after(self.machine_player_object.frame_interval(), self.poll_frames)
         self.mainloop()
+        if self.is_machine_playing():
+            self.machine_player_object.stop()
 
     def is_machine_playing(self):
         return self.machine_player_object is not None
@@ -61,10 +64,11 @@ class GameGrid(Frame):
     def init_grid(self):
         background = Frame(self, bg=BACKGROUND_COLOR_GAME, width=SIZE, height=SIZE)
         background.grid()
-        for i in range(GRID_LEN):
+        side = max(self.rows, self.cols)
+        for i in range(self.rows):
             grid_row = []
-            for j in range(GRID_LEN):
-                cell = Frame(background, bg=BACKGROUND_COLOR_CELL_EMPTY, width=SIZE / GRID_LEN, height=SIZE / GRID_LEN)
+            for j in range(self.cols):
+                cell = Frame(background, bg=BACKGROUND_COLOR_CELL_EMPTY, width=SIZE / side, height=SIZE / side)
                 cell.grid(row=i, column=j, padx=GRID_PADDING, pady=GRID_PADDING)
                 # font = Font(size=FONT_SIZE, family=FONT_FAMILY, weight=FONT_WEIGHT)
                 t = Label(master=cell, text="", bg=BACKGROUND_COLOR_CELL_EMPTY, justify=CENTER, font=FONT, width=4,
@@ -75,18 +79,18 @@ class GameGrid(Frame):
             self.grid_cells.append(grid_row)
 
     def gen(self):
-        return randint(0, GRID_LEN - 1)
-
-    def update_grid_cells(self):
-        for i in range(GRID_LEN):
-            for j in range(GRID_LEN):
-                new_number = self.game.matrix[i][j]
-                if new_number == 0:
-                    self.grid_cells[i][j].configure(text="", bg=BACKGROUND_COLOR_CELL_EMPTY)
-                else:
-                    self.grid_cells[i][j].configure(text=str(new_number), bg=BACKGROUND_COLOR_DICT[2048 if new_number > 2048 else new_number],
-                                                    fg=CELL_COLOR_DICT[2048 if new_number > 2048 else new_number])
-        self.update_idletasks()
+        return randint(0, min(self.rows, self.cols) - 1)
+
+    def update_grid_cells(self, matrix=None):
+        # the widgets are redrawn by the main loop once it's idle, moves arriving before that share one redraw
+        matrix = self.game.matrix if matrix is None else matrix
+        rendered = self.rendered
+        for i in range(self.rows):
+            row = matrix[i]
+            for j in range(self.cols):
+                if rendered is None or rendered[i][j] != row[j]:
+                    self.grid_cells[i][j].configure(**cell_style(row[j]))
+        self.rendered = [row[:] for row in matrix]
 
     def key_down(self, event):
         if self.game.is_over():
@@ -95,6 +99,7 @@ class GameGrid(Frame):
         if self.is_machine_playing():
             if key == "' '":
                 self.pause = not self.pause
+                self.machine_player_object.set_paused(self.pause)
                 self.master.title("Paused" if self.pause else "Mohsen is playing")
             return
         if key in self.commands:
@@ -103,27 +108,49 @@ class GameGrid(Frame):
         else:
             print("invalid key")
 
-    def move(self, cmd):
+    def play_move(self, cmd):
+        # plays and records the move without touching any widget, the machine player calls it from its thread
         matrix = self.game.matrix
         bonus_score = self.game.move(cmd)
         if bonus_score != -1:
-            print("bonus score: ", bonus_score)
             self.history.add_step(matrix, cmd, bonus_score, self.game.true_score)
-            self.update_grid_cells()
             if self.game.is_over():
-                self.master.title("You Lose! (Score: {})".format(self.game.true_score))
                 self.history.total_score = self.game.true_score
                 self.history.total_moves = self.game.total_moves
                 self.history.invalid_moves = self.game.invalid_moves
-                if self.is_machine_playing():
-                    self.history.dump_to_file("{}/{}.hxp".format(self.machine_player_object.samples_directory_name, int(time.time())))
-                else:
-                    self.history.dump_to_file("human_played_samples/{}.hxp".format(int(time.time())))
+                self.history.close()
+        return bonus_score
+
+    def move(self, cmd):
+        bonus_score = self.play_move(cmd)
+        if bonus_score != -1:
+            print("bonus score: ", bonus_score)
+            self.update_grid_cells()
+            if self.game.is_over():
+                self.show_game_over(self.game.true_score)
                 print("total score:", self.game.true_score)
         else:
             print("invalid move", cmd)
         return bonus_score
 
+    def show_game_over(self, score):
+        self.master.title("You Lose! (Score: {})".format(score))
+
+    def poll_frames(self):
+        # shows the next frame the machine player queued, at most fps times a second (the newest one when
+        # the player skips frames, it keeps only that one queued)
+        try:
+            frame = self.machine_player_object.frames.get_nowait()
+        except queue.Empty:
+            frame = None
+        if frame is not None:
+            matrix, score, over = frame
+            self.update_grid_cells(matrix)
+            if over:
+                self.show_game_over(score)
+                return
+        self.after(self.machine_player_object.frame_interval(), self.poll_frames)
+
     # def generate_next(self):
     #     index = (self.gen(), self.gen())
     #     while self.matrix[index[0]][index[1]] != 0:
@@ -0,0 +1,134 @@
+import sys
+import time
+
+#
+# Renderers show a game while a machine player plays it
+#
+# A renderer gets render() after every valid move and game_over() once when the game ends. NullRenderer
+# draws nothing and TerminalRenderer draws with ANSI escapes, neither needs a display. TkRenderer draws
+# in a GameGrid window; tkinter is imported only when one is created.
+#
+
+SIZE = 500
+GRID_PADDING = 10
+
+BACKGROUND_COLOR_GAME = "#92877d"
+BACKGROUND_COLOR_CELL_EMPTY = "#9e948a"
+BACKGROUND_COLOR_DICT = {2: "#eee4da", 4: "#ede0c8", 8: "#f2b179", 16: "#f59563", \
+                         32: "#f67c5f", 64: "#f65e3b", 128: "#edcf72", 256: "#edcc61", \
+                         512: "#edc850", 1024: "#edc53f", 2048: "#edc22e"}
+CELL_COLOR_DICT = {2: "#776e65", 4: "#776e65", 8: "#f9f6f2", 16: "#f9f6f2", \
+                   32: "#f9f6f2", 64: "#f9f6f2", 128: "#f9f6f2", 256: "#f9f6f2", \
+                   512: "#f9f6f2", 1024: "#f9f6f2", 2048: "#f9f6f2"}
+FONT = ("Verdana", 40, "bold")
+
+
+def compute_cell_style(value):
+    if value == 0:
+        return {"text": "", "bg": BACKGROUND_COLOR_CELL_EMPTY}
+    color = 2048 if value > 2048 else value
+    return {"text": str(value), "bg": BACKGROUND_COLOR_DICT[color], "fg": CELL_COLOR_DICT[color]}
+
+
+# Label options of every tile value, so a redraw is one dict lookup and one configure per changed cell
+CELL_STYLES = {value: compute_cell_style(value) for value in [0] + [2 ** exponent for exponent in range(1, 18)]}
+
+
+def cell_style(value):
+    if value not in CELL_STYLES:
+        CELL_STYLES[value] = compute_cell_style(value)
+    return CELL_STYLES[value]
+
+
+class Renderer:
+
+    def render(self, matrix, score):
+        raise NotImplementedError()
+
+    def game_over(self, score):
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class NullRenderer(Renderer):
+
+    def render(self, matrix, score):
+        pass
+
+    def game_over(self, score):
+        pass
+
+
+def ansi_color(hex_color, background):
+    red, green, blue = int(hex_color[1:3], 16), int(hex_color[3:5], 16), int(hex_color[5:7], 16)
+    return "\x1b[{};2;{};{};{}m".format(48 if background else 38, red, green, blue)
+
+
+class TerminalRenderer(Renderer):
+    # redraws the board in place, at most fps times a second (the final board is always drawn)
+
+    def __init__(self, stream=None, fps=30, color=True, cell_width=7):
+        self.stream = stream if stream is not None else sys.stdout
+        self.frame_interval = 1.0 / fps if fps else 0.0
+        self.color = color
+        self.cell_width = cell_width
+        self.last_frame_time = None
+        self.skipped_matrix = None  # newest board not drawn because it came too soon after the last frame
+        self.cleared = False
+
+    def format_cell(self, value):
+        text = (str(value) if value else "").center(self.cell_width)
+        if not self.color:
+            return "[{}]".format(text)
+        if value == 0:
+            return ansi_color(BACKGROUND_COLOR_CELL_EMPTY, True) + text + "\x1b[0m"
+        color = 2048 if value > 2048 else value
+        return ansi_color(BACKGROUND_COLOR_DICT[color], True) + ansi_color(CELL_COLOR_DICT[color], False) + \
+            "\x1b[1m" + text + "\x1b[0m"
+
+    def draw(self, matrix, title):
+        lines = ["\x1b[H" if self.cleared else "\x1b[2J\x1b[H", title, "\x1b[K\n"]
+        for row in matrix:
+            lines.append(" ".join(self.format_cell(value) for value in row))
+            lines.append("\x1b[K\n")
+        self.stream.write("".join(lines))
+        self.stream.flush()
+        self.cleared = True
+
+    def render(self, matrix, score):
+        now = time.perf_counter()
+        if self.last_frame_time is not None and now - self.last_frame_time < self.frame_interval:
+            self.skipped_matrix = matrix
+            return
+        self.last_frame_time = now
+        self.draw(matrix, "Score: {}".format(score))
+        self.skipped_matrix = None
+
+    def game_over(self, score):
+        if self.skipped_matrix is not None:
+            self.draw(self.skipped_matrix, "Score: {}".format(score))
+        self.stream.write("Game over! (Score: {})\n".format(score))
+        self.stream.flush()
+
+
+class TkRenderer(Renderer):
+    # draws in a GameGrid window from the calling thread, which has to be the one that created it
+
+    def __init__(self, grid_len=4):
+        from puzzle import GameGrid
+        self.grid = GameGrid(grid_len=grid_len, start=False)
+        self.grid.master.unbind("<Key>")
+
+    def render(self, matrix, score):
+        self.grid.update_grid_cells(matrix)
+        self.grid.master.title("Score: {}".format(score))
+        self.grid.update()
+
+    def game_over(self, score):
+        self.grid.show_game_over(score)
+        self.grid.update()
+
+    def close(self):
+        self.grid.master.destroy()
@@ -0,0 +1,312 @@
+import csv
+import json
+import math
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import bitboard
+from game_history import iter_steps, read_header
+
+#
+# Streaming analytics over samples directories
+#
+# Every .hxp file (either format) is read step by step, never loaded whole: .hxp v2 files through
+# game_history.iter_steps and JSON histories with an incremental decoder over the game_steps list.
+# Files are summarized in a process pool, a bounded number at a time, and every summary is folded
+# into the Aggregate of its directory as it arrives, so memory doesn't grow with the corpus: scores
+# and move counts go to log-spaced histograms (percentiles within HISTOGRAM_BASE relative error),
+# the score by move number to sums over MOVE_BUCKET-move buckets. Files that can't be read (empty,
+# truncated JSON, unknown format) are counted and listed instead of stopping the run.
+#
+# Each directory on the command line is one group in the output, e.g. one per algorithm:
+#   python replay_analytics.py astar=astar_samples random=random_samples -f csv
+#
+
+HISTOGRAM_BASE = 1.01
+MOVE_BUCKET = 50
+READ_SIZE = 64 * 1024
+PERCENTILES = (50, 90, 99)
+
+
+class CorruptHistory(Exception):
+    pass
+
+
+# ------------------------------- Step streams -------------------------------
+def iter_json_steps(path, summary):
+    # yields the steps of a JSON GameHistory one by one; the other top level fields are put in summary
+    decoder = json.JSONDecoder()
+    with open(path) as file:
+        buffer = file.read(READ_SIZE)
+        start = buffer.find('"game_steps"')
+        if not buffer.lstrip().startswith("{") or start == -1:
+            raise CorruptHistory("not a game history")
+        prefix = buffer[:start]
+        position = buffer.index("[", start) + 1
+        end_of_file = False
+        while True:
+            while True:
+                # skip separators, reading on when the buffer runs out
+                while position < len(buffer) and buffer[position] in " \t\r\n,":
+                    position += 1
+                if position < len(buffer) or end_of_file:
+                    break
+                buffer, position = file.read(READ_SIZE), 0
+                end_of_file = not buffer
+            if position >= len(buffer):
+                raise CorruptHistory("truncated")
+            if buffer[position] == "]":
+                break
+            try:
+                step, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                more = file.read(READ_SIZE)
+                if not more:
+                    raise CorruptHistory("truncated")
+                buffer, position = buffer[position:] + more, 0
+                continue
+            position = end
+            yield step
+        rest = buffer[position + 1:] + file.read()
+    try:
+        summary.update(json.loads(prefix + '"game_steps": null' + rest))
+    except ValueError:
+        raise CorruptHistory("truncated")
+
+
+def iter_binary_steps(path, summary):
+    # yields the steps of a .hxp v2 file with the board unpacked to a value matrix
+    with open(path, "rb") as file:
+        header = read_header(file)
+    kernel = bitboard.kernel(header["rows"], header["cols"])
+    summary.update(header)
+    for board, move, move_score, total_score in iter_steps(path):
+        yield {"game_state": kernel.unpack(board), "move": move, "move_score": move_score,
+               "total_score_after_move": total_score}
+
+
+def iter_game_steps(path, summary):
+    with open(path, "rb") as file:
+        magic = file.read(4)
+    if not magic:
+        raise CorruptHistory("empty file")
+    if magic == b"HXP2":
+        return iter_binary_steps(path, summary)
+    return iter_json_steps(path, summary)
+
+
+# ------------------------------- Per file summary -------------------------------
+def analyze_file(path):
+    # one pass over a game: its totals, largest tile and total score every MOVE_BUCKET steps
+    summary = {}
+    try:
+        steps = 0
+        largest = 0
+        score_by_bucket = []
+        last = None
+        total_score = 0
+        for step in iter_game_steps(path, summary):
+            if steps % MOVE_BUCKET == 0:
+                score_by_bucket.append(step["total_score_after_move"] - step["move_score"])
+            largest = max(largest, max(max(row) for row in step["game_state"]))
+            total_score = step["total_score_after_move"]
+            last = step
+            steps += 1
+    except (CorruptHistory, OSError, ValueError, KeyError, TypeError) as error:
+        return {"path": path, "error": str(error) or type(error).__name__}
+    if last is not None:
+        # the last recorded board is the one before the final move, play it to see the final largest tile
+        kernel = bitboard.kernel_for(last["game_state"])
+        after = kernel.moves[last["move"]](kernel.pack(last["game_state"]))[0]
+        largest = max(largest, max(max(row) for row in kernel.unpack(after)))
+    total_moves = summary.get("total_moves") or steps
+    return {
+        "path": path,
+        "score": summary.get("total_score") or total_score,
+        "steps": steps,
+        "total_moves": total_moves,
+        "invalid_moves": summary.get("invalid_moves", 0),
+        "largest_number": largest,
+        "score_by_bucket": score_by_bucket,
+    }
+
+
+# ------------------------------- Aggregation -------------------------------
+class LogHistogram:
+    # counts of non-negative values in log-spaced bins, percentiles within HISTOGRAM_BASE relative error
+
+    def __init__(self):
+        self.bins = {}
+        self.count = 0
+        self.total = 0
+
+    def add(self, value):
+        key = int(math.log(value + 1, HISTOGRAM_BASE))
+        self.bins[key] = self.bins.get(key, 0) + 1
+        self.count += 1
+        self.total += value
+
+    def percentile(self, percent):
+        if self.count == 0:
+            return None
+        rank = percent / 100.0 * self.count
+        seen = 0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen >= rank:
+                # the middle of the bin
+                return HISTOGRAM_BASE ** (key + 0.5) - 1
+        return HISTOGRAM_BASE ** (max(self.bins) + 0.5) - 1
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+
+class Aggregate:
+
+    def __init__(self, name):
+        self.name = name
+        self.games = 0
+        self.steps = 0
+        self.total_moves = 0
+        self.invalid_moves = 0
+        self.illegal_move_ratio_sum = 0.0  # of Game.illegal_move_ratio, for the mean over games
+        self.scores = LogHistogram()
+        self.moves = LogHistogram()
+        self.largest_numbers = {}
+        self.score_sums = []  # by MOVE_BUCKET move bucket
+        self.score_counts = []
+        self.errors = []
+
+    def add(self, summary):
+        if "error" in summary:
+            self.errors.append((summary["path"], summary["error"]))
+            return
+        self.games += 1
+        self.steps += summary["steps"]
+        self.total_moves += summary["total_moves"]
+        self.invalid_moves += summary["invalid_moves"]
+        if summary["total_moves"]:
+            self.illegal_move_ratio_sum += summary["invalid_moves"] / summary["total_moves"]
+        self.scores.add(summary["score"])
+        self.moves.add(summary["total_moves"])
+        largest = summary["largest_number"]
+        self.largest_numbers[largest] = self.largest_numbers.get(largest, 0) + 1
+        for bucket, score in enumerate(summary["score_by_bucket"]):
+            if bucket == len(self.score_sums):
+                self.score_sums.append(0)
+                self.score_counts.append(0)
+            self.score_sums[bucket] += score
+            self.score_counts[bucket] += 1
+
+    def report(self):
+        return {
+            "games": self.games,
+            "corrupt_files": len(self.errors),
+            "steps": self.steps,
+            "mean_score": self.scores.mean(),
+            "score_percentiles": {str(p): self.scores.percentile(p) for p in PERCENTILES},
+            "mean_moves": self.moves.mean(),
+            "moves_percentiles": {str(p): self.moves.percentile(p) for p in PERCENTILES},
+            "invalid_move_ratio": self.invalid_moves / self.total_moves if self.total_moves else None,
+            "mean_illegal_move_ratio": self.illegal_move_ratio_sum / self.games if self.games else None,
+            "largest_number_histogram": {str(tile): self.largest_numbers[tile] for tile in sorted(self.largest_numbers)},
+            "mean_score_by_move": {str(bucket * MOVE_BUCKET): self.score_sums[bucket] / self.score_counts[bucket]
+                                   for bucket in range(len(self.score_sums))},
+            "errors": [{"path": path, "error": error} for path, error in self.errors],
+        }
+
+
+# ------------------------------- Pipeline -------------------------------
+def iter_paths(directory):
+    with os.scandir(directory) as entries:
+        for entry in sorted(entries, key=lambda entry: entry.name):
+            if entry.name.endswith(".hxp") and entry.is_file():
+                yield entry.path
+
+
+def bounded_map(pool, function, items, window):
+    # pool.map that submits at most `window` items ahead of the results taken, in order
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(function, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def analyze(groups, workers=None):
+    # groups: [(name, directory)]; returns {name: Aggregate.report()}
+    aggregates = {name: Aggregate(name) for name, _ in groups}
+    items = ((name, path) for name, directory in groups for path in iter_paths(directory))
+    if workers == 1:
+        pool = None
+        results = ((name, analyze_file(path)) for name, path in items)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        window = 4 * (workers or os.cpu_count() or 1)
+        names = deque()
+
+        def paths():
+            for name, path in items:
+                names.append(name)
+                yield path
+        results = ((names.popleft(), summary)
+                   for summary in bounded_map(pool, analyze_file, paths(), window))
+    try:
+        for name, summary in results:
+            aggregates[name].add(summary)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return {name: aggregate.report() for name, aggregate in aggregates.items()}
+
+
+def csv_rows(reports):
+    # one (group, metric, key, value) row per number, nested dicts flattened into their keys
+    for name, report in reports.items():
+        for metric, value in report.items():
+            if metric == "errors":
+                for error in value:
+                    yield name, "error", error["path"], error["error"]
+            elif isinstance(value, dict):
+                for key, item in value.items():
+                    yield name, metric, key, item
+            else:
+                yield name, metric, "", value
+
+
+def parse_group(argument):
+    # "name=directory" or just "directory", named after itself
+    name, separator, directory = argument.partition("=")
+    if not separator:
+        return os.path.basename(os.path.normpath(argument)), argument
+    return name, directory
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Streaming statistics over samples directories of .hxp games")
+    parser.add_argument("directories", nargs="+", help="samples directories, name=directory to label a group")
+    parser.add_argument("-f", "--format", choices=["json", "csv"], default="json")
+    parser.add_argument("-o", "--output", help="write to this file instead of stdout")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="processes, 1 to analyze in this one")
+    args = parser.parse_args()
+    reports = analyze([parse_group(directory) for directory in args.directories], args.workers)
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        if args.format == "json":
+            json.dump(reports, output, indent=2)
+            output.write("\n")
+        else:
+            writer = csv.writer(output)
+            writer.writerow(["group", "metric", "key", "value"])
+            writer.writerows(csv_rows(reports))
+    finally:
+        if args.output:
+            output.close()
+    for name, report in reports.items():
+        if report["corrupt_files"]:
+            print("{}: skipped {} corrupt file(s)".format(name, report["corrupt_files"]), file=sys.stderr)
@@ -0,0 +1,180 @@
+import json
+import os
+import numpy as np
+import bitboard
+from game_history import HEADER, STEP, read_header
+
+#
+# Random access over every .hxp v2 game in a samples directory
+#
+# The directory is indexed once (step count and final stats of every game) and the index is cached
+# next to the samples; it is only rebuilt for files that are new or changed since. Step records are
+# memory-mapped, so boards, moves and rewards come back as NumPy views of the files themselves.
+# Only 4x4 games are loaded; games on other board sizes are listed in skipped.
+#
+
+STEP_DTYPE = np.dtype([("board", "<u8"), ("move", "u1"), ("move_score", "<i4"), ("total_score", "<u4")])
+INDEX_FILE_NAME = ".hxp_index.json"
+INDEX_VERSION = 2
+NIBBLE_SHIFTS = np.arange(0, 64, 4, dtype=np.uint64)
+
+assert STEP_DTYPE.itemsize == STEP.size
+
+
+def unpack_boards(boards):
+    # packed bitboards -> (N, 4, 4) uint8 tile exponents
+    boards = np.asarray(boards, dtype=np.uint64)
+    return ((boards[..., None] >> NIBBLE_SHIFTS) & np.uint64(0xF)).astype(np.uint8).reshape(boards.shape + (4, 4))
+
+
+def canonical_boards(boards):
+    # the smallest of the 8 symmetric forms of every packed board
+    boards = np.asarray(boards, dtype=np.uint64)
+    return np.minimum.reduce(bitboard.symmetries(boards))
+
+
+def index_game(path):
+    size = os.path.getsize(path)
+    with open(path, "rb") as file:
+        header = read_header(file)
+        if header is None:
+            return None
+        # unfinished games are recovered from whatever steps reached the disk
+        step_count = (size - HEADER.size) // STEP.size
+        total_score = header["total_score"]
+        if not header["finished"] and step_count > 0:
+            file.seek(HEADER.size + (step_count - 1) * STEP.size)
+            total_score = STEP.unpack(file.read(STEP.size))[3]
+    return {
+        "size": size,
+        "mtime_ns": os.stat(path).st_mtime_ns,
+        "step_count": step_count,
+        "finished": header["finished"],
+        "rows": header["rows"],
+        "cols": header["cols"],
+        "total_score": total_score,
+        "total_moves": header["total_moves"],
+        "invalid_moves": header["invalid_moves"],
+    }
+
+
+def load_index(samples_directory_name, rebuild=False):
+    index_path = os.path.join(samples_directory_name, INDEX_FILE_NAME)
+    cached = {}
+    if not rebuild and os.path.exists(index_path):
+        try:
+            with open(index_path) as file:
+                data = json.load(file)
+            if data.get("version") == INDEX_VERSION:
+                cached = data["files"]
+        except ValueError:
+            cached = {}
+    games = {}
+    changed = False
+    for name in sorted(os.listdir(samples_directory_name)):
+        if not name.endswith(".hxp"):
+            continue
+        path = os.path.join(samples_directory_name, name)
+        stat = os.stat(path)
+        entry = cached.get(name)
+        if entry is None or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+            entry = index_game(path) or {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "step_count": None}
+            changed = True
+        games[name] = entry
+    if changed or len(games) != len(cached):
+        temp_path = index_path + ".{}.tmp".format(os.getpid())
+        with open(temp_path, "w") as file:
+            json.dump({"version": INDEX_VERSION, "files": games}, file)
+        os.replace(temp_path, index_path)
+    return games
+
+
+class ReplayDataset:
+
+    def __init__(self, samples_directory_name, min_total_score=None, rebuild_index=False):
+        self.samples_directory_name = samples_directory_name
+        index = load_index(samples_directory_name, rebuild_index)
+        # step_count is None for files that aren't .hxp v2 (e.g. old JSON histories)
+        self.skipped = [name for name, entry in index.items()
+                        if entry["step_count"] is None or (entry["rows"], entry["cols"]) != (4, 4)]
+        self.names = [name for name, entry in index.items()
+                      if entry["step_count"] and name not in self.skipped and (min_total_score is None or entry["total_score"] >= min_total_score)]
+        self.games = [index[name] for name in self.names]
+        self.offsets = np.cumsum([0] + [game["step_count"] for game in self.games])
+        self.maps = [None] * len(self.names)
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def game_count(self):
+        return len(self.names)
+
+    def steps(self, game):
+        # all step records of one game as a memory-mapped structured array
+        if self.maps[game] is None:
+            self.maps[game] = np.memmap(os.path.join(self.samples_directory_name, self.names[game]), dtype=STEP_DTYPE,
+                                        mode="r", offset=HEADER.size, shape=(self.games[game]["step_count"],))
+        return self.maps[game]
+
+    def boards(self, game):
+        return self.steps(game)["board"]
+
+    def moves(self, game):
+        return self.steps(game)["move"]
+
+    def rewards(self, game):
+        return self.steps(game)["move_score"]
+
+    def locate(self, index):
+        # global step index -> (game, step within the game)
+        index = np.asarray(index)
+        if (index < 0).any() or (index >= len(self)).any():
+            raise IndexError("step index out of range")
+        game = np.searchsorted(self.offsets, index, side="right") - 1
+        return game, index - self.offsets[game]
+
+    def __getitem__(self, index):
+        if np.isscalar(index):
+            game, step = self.locate(index)
+            return self.steps(int(game))[int(step)]
+        return self.gather(index)
+
+    def gather(self, indices):
+        # copies the requested steps into (boards, moves, rewards) arrays
+        indices = np.asarray(indices)
+        games, steps = self.locate(indices)
+        records = np.empty(len(indices), dtype=STEP_DTYPE)
+        for game in np.unique(games):
+            selected = games == game
+            records[selected] = self.steps(int(game))[steps[selected]]
+        return records["board"], records["move"], records["move_score"]
+
+    def unique_steps(self, canonical=True):
+        # global indices of the first step of every distinct (optionally symmetry-canonical) board
+        boards = np.concatenate([self.boards(game) for game in range(self.game_count())]) if len(self) else \
+            np.empty(0, dtype=np.uint64)
+        if canonical:
+            boards = canonical_boards(boards)
+        return np.sort(np.unique(boards, return_index=True)[1])
+
+    def minibatches(self, batch_size, shuffle=True, seed=None, drop_last=False):
+        order = np.arange(len(self))
+        if shuffle:
+            np.random.default_rng(seed).shuffle(order)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            if drop_last and len(batch) < batch_size:
+                return
+            yield self.gather(batch)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    start_time = time.time()
+    dataset = ReplayDataset(sys.argv[1] if len(sys.argv) > 1 else "machine_played_samples")
+    print("Indexed {} games / {} steps in {:.3f}s ({} files skipped)".format(
+        dataset.game_count(), len(dataset), time.time() - start_time, len(dataset.skipped)))
+    start_time = time.time()
+    batches = sum(1 for _ in dataset.minibatches(256, seed=0))
+    print("Iterated {} shuffled minibatches in {:.3f}s".format(batches, time.time() - start_time))
@@ -0,0 +1,106 @@
+import random
+import bitboard
+
+#
+# Mutable game state for tree search
+#
+# Unlike Game, which is cloned for every node, one SearchState is threaded through a whole search:
+# apply() makes a move in place and undo() takes it back. The board is a packed bitboard and the
+# undo stack only holds the previous board, its masks and the bonus of every applied move.
+#
+
+class SearchState:
+    # Besides the board, the state tracks which cells are empty (bitboard.empty_cells_mask) and which
+    # rows/columns can merge (bitboard.merge_lines). Both are refreshed from the board after a move and
+    # patched for the one changed cell after a spawn, so is_over is a comparison and spawns pick their
+    # cell straight from the mask. The kernel (bitboard.kernel) sets the board size, 4x4 by default.
+    __slots__ = ("board", "kernel", "empty_mask", "merge_lines", "score", "true_score", "invalid_moves", "total_moves",
+                 "rng", "undo_stack")
+
+    def __init__(self, board=0, rng=random, kernel=None):
+        self.board = board
+        self.kernel = kernel or bitboard.kernel(4)
+        self.empty_mask = self.kernel.empty_cells_mask(board)
+        self.merge_lines = self.kernel.merge_lines(board)
+        self.score = 0
+        self.true_score = 0
+        self.invalid_moves = 0
+        self.total_moves = 0
+        self.rng = rng  # anything with randrange, the random module by default
+        self.undo_stack = []
+
+    @classmethod
+    def from_matrix(cls, matrix, rng=random):
+        kernel = bitboard.kernel_for(matrix)
+        return cls(kernel.pack(matrix), rng, kernel)
+
+    @property
+    def matrix(self):
+        return self.kernel.unpack(self.board)
+
+    def push(self, bonus_score):
+        self.undo_stack.append(self.board)
+        self.undo_stack.append(self.empty_mask << 16 | self.merge_lines)
+        self.undo_stack.append(bonus_score)
+
+    def apply(self, move, spawn=True):
+        # same scoring as Game.move: the merge bonus for a valid move, -1 for an invalid one
+        board, done, bonus_score = self.kernel.moves[move](self.board)
+        if done:
+            self.enter(board, bonus_score, spawn)
+            return bonus_score
+        self.total_moves += 1
+        self.push(-1)
+        self.invalid_moves += 1
+        self.score -= 1
+        return -1
+
+    def afterstates(self):
+        # (boards, bonuses, legal) of the 4 moves from the current board, see bitboard.afterstates
+        return self.kernel.afterstates(self.board)
+
+    def apply_afterstate(self, board, bonus_score, spawn=True):
+        # a legal move given by its afterstate and bonus from afterstates(), undone like apply
+        self.enter(board, bonus_score, spawn)
+        return bonus_score
+
+    def enter(self, board, bonus_score, spawn):
+        self.total_moves += 1
+        self.push(bonus_score)
+        self.board = board
+        self.empty_mask = self.kernel.empty_cells_mask(board)
+        self.merge_lines = self.kernel.merge_lines(board)
+        if spawn:
+            self.add_two()
+        self.score += bonus_score
+        self.true_score += bonus_score
+
+    def place(self, shift, exponent):
+        self.board |= exponent << shift
+        self.empty_mask &= ~(1 << shift)
+        self.merge_lines = self.kernel.update_merge_lines(self.board, self.merge_lines, shift)
+
+    def undo(self):
+        bonus_score = self.undo_stack.pop()
+        masks = self.undo_stack.pop()
+        self.board = self.undo_stack.pop()
+        self.empty_mask = masks >> 16
+        self.merge_lines = masks & 0xFFFF
+        self.total_moves -= 1
+        if bonus_score == -1:
+            self.invalid_moves -= 1
+            self.score += 1
+        else:
+            self.score -= bonus_score
+            self.true_score -= bonus_score
+
+    def add_two(self):
+        if self.empty_mask:
+            count = bin(self.empty_mask).count("1")
+            self.place(bitboard.select_cell(self.empty_mask, self.rng.randrange(count)), 1)
+
+    def is_over(self):
+        return self.empty_mask == 0 and self.merge_lines == 0
+
+    def depth(self):
+        return len(self.undo_stack) // 3
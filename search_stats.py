@@ -0,0 +1,163 @@
+import random
+import time
+from search_state import SearchState
+
+#
+# Opt-in instrumentation for the search players
+#
+# A player given an instrumentation callable (e.g. a SearchStatsCollector) fills one SearchStats per
+# decision and passes it to the callable. Tree searches then run on InstrumentedSearchState, which
+# counts and times every apply, afterstates and is_over, and their evaluator is wrapped in a
+# TimedEvaluator.
+# Without instrumentation the players build a plain SearchState and nothing here is called.
+#
+
+
+def effective_branching_factor(nodes, depth):
+    # b with b + b^2 + ... + b^depth = nodes, the uniform tree that would expand as many nodes
+    if nodes <= 0 or depth <= 0:
+        return 0.0
+    low, high = 0.0, max(float(nodes), 1.0)
+    for _ in range(64):
+        b = (low + high) / 2
+        if sum(b ** d for d in range(1, depth + 1)) < nodes:
+            low = b
+        else:
+            high = b
+    return (low + high) / 2
+
+
+class SearchStats:
+    __slots__ = ("nodes", "max_depth", "illegal_moves", "pruned", "cache_hits", "cache_lookups", "budget_exhausted",
+                 "move_time", "game_over_time", "evaluate_time", "total_time")
+
+    def __init__(self):
+        self.nodes = 0  # legal moves applied below the root
+        self.max_depth = 0  # deepest move applied, the root move is depth 1
+        self.illegal_moves = 0  # moves tried that didn't change the board
+        self.pruned = 0  # subtrees cut off without being searched (e.g. Expectimax probability cutoff)
+        self.cache_hits = 0
+        self.cache_lookups = 0
+        self.budget_exhausted = False
+        self.move_time = 0.0  # seconds in apply, moves and spawns
+        self.game_over_time = 0.0  # seconds in is_over
+        self.evaluate_time = 0.0  # seconds in the leaf evaluator
+        self.total_time = 0.0
+
+    def merge(self, other):
+        # adds the counts of a subtree searched elsewhere (e.g. in a worker process)
+        self.nodes += other.nodes
+        self.max_depth = max(self.max_depth, other.max_depth)
+        self.illegal_moves += other.illegal_moves
+        self.pruned += other.pruned
+        self.cache_hits += other.cache_hits
+        self.cache_lookups += other.cache_lookups
+        self.budget_exhausted = self.budget_exhausted or other.budget_exhausted
+        self.move_time += other.move_time
+        self.game_over_time += other.game_over_time
+        self.evaluate_time += other.evaluate_time
+
+    def branching_factor(self):
+        return effective_branching_factor(self.nodes, self.max_depth)
+
+    def other_time(self):
+        # search bookkeeping: everything that isn't a move, a game over check or an evaluation
+        return max(self.total_time - self.move_time - self.game_over_time - self.evaluate_time, 0.0)
+
+    def as_dict(self):
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data["branching_factor"] = self.branching_factor()
+        data["other_time"] = self.other_time()
+        return data
+
+    def __getstate__(self):
+        return [getattr(self, name) for name in self.__slots__]
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+
+class SearchStatsCollector:
+    # in-memory instrumentation: keeps the SearchStats of every decision and forwards it to callback
+
+    def __init__(self, callback=None):
+        self.decisions = []
+        self.callback = callback
+
+    def __call__(self, stats):
+        self.decisions.append(stats)
+        if self.callback is not None:
+            self.callback(stats)
+
+    def __len__(self):
+        return len(self.decisions)
+
+    def summary(self):
+        total = SearchStats()
+        for stats in self.decisions:
+            total.merge(stats)
+            total.total_time += stats.total_time
+        data = total.as_dict()
+        data["decisions"] = len(self.decisions)
+        data["nodes_per_second"] = total.nodes / total.total_time if total.total_time > 0 else 0.0
+        return data
+
+
+class InstrumentedSearchState(SearchState):
+    __slots__ = ("stats",)
+
+    def __init__(self, board=0, rng=random, kernel=None, stats=None):
+        super().__init__(board, rng, kernel)
+        self.stats = stats if stats is not None else SearchStats()
+
+    def apply(self, move, spawn=True):
+        start_time = time.perf_counter()
+        bonus_score = super().apply(move, spawn)
+        stats = self.stats
+        stats.move_time += time.perf_counter() - start_time
+        if bonus_score == -1:
+            stats.illegal_moves += 1
+        else:
+            self.count_node()
+        return bonus_score
+
+    def afterstates(self):
+        start_time = time.perf_counter()
+        afterstates = super().afterstates()
+        self.stats.move_time += time.perf_counter() - start_time
+        self.stats.illegal_moves += 4 - bin(afterstates[2]).count("1")
+        return afterstates
+
+    def apply_afterstate(self, board, bonus_score, spawn=True):
+        start_time = time.perf_counter()
+        super().apply_afterstate(board, bonus_score, spawn)
+        self.stats.move_time += time.perf_counter() - start_time
+        self.count_node()
+        return bonus_score
+
+    def count_node(self):
+        self.stats.nodes += 1
+        if self.depth() > self.stats.max_depth:
+            self.stats.max_depth = self.depth()
+
+    def is_over(self):
+        start_time = time.perf_counter()
+        over = super().is_over()
+        self.stats.game_over_time += time.perf_counter() - start_time
+        return over
+
+
+class TimedEvaluator:
+    # wraps a heuristic.py evaluator for one instrumented search
+
+    def __init__(self, evaluator, stats):
+        self.evaluator = evaluator
+        self.stats = stats
+        self.lost_value = evaluator.lost_value
+
+    def __call__(self, board):
+        start_time = time.perf_counter()
+        value = self.evaluator(board)
+        self.stats.evaluate_time += time.perf_counter() - start_time
+        return value
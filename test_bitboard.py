@@ -0,0 +1,18 @@
+import pytest
+import bitboard
+
+
+@pytest.mark.parametrize("rows, cols, boards", [(4, 4, 10000), (3, 3, 2000), (3, 5, 2000), (5, 3, 2000), (5, 5, 500)])
+def test_moves_match_logic(rows, cols, boards):
+    assert bitboard.cross_check(boards, seed=rows * 10 + cols, rows=rows, cols=cols) == boards
+
+
+def test_pack_rejects_tiles_past_32768():
+    matrix = [[0] * 4 for _ in range(4)]
+    matrix[1][2] = 32768
+    assert bitboard.unpack(bitboard.pack(matrix)) == matrix
+    matrix[1][2] = 65536
+    with pytest.raises(ValueError):
+        bitboard.pack(matrix)
+    with pytest.raises(ValueError):
+        bitboard.kernel(3, 5).pack([[0, 0, 65536, 0, 0], [0] * 5, [0] * 5])
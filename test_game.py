@@ -0,0 +1,26 @@
+import random
+import pytest
+import logic
+from game import Game
+
+
+@pytest.mark.parametrize("size", [4, 3, 5, (3, 5), (5, 3), (2, 6), (6, 2)])
+def test_is_over_matches_game_state(size):
+    # the tracked masks have to agree with a full game_state scan after every move of random games
+    rng = random.Random(str(size))
+    for seed in range(50):
+        game = Game(size=size, seed=seed)
+        while True:
+            assert game.is_over() == (logic.game_state(game.matrix) == "lose")
+            if game.is_over():
+                break
+            game.move(rng.randrange(4))
+
+
+def test_is_over_on_full_boards():
+    # random full boards of 8 distinct tiles, enough of them stuck to test both outcomes
+    rng = random.Random(0)
+    for rows, cols in [(4, 4), (3, 5), (2, 6)]:
+        for _ in range(2000):
+            matrix = [[rng.choice((2, 4, 8, 16, 32, 64, 128, 256)) for _ in range(cols)] for _ in range(rows)]
+            assert Game(matrix).is_over() == (logic.game_state(matrix) == "lose")
@@ -0,0 +1,109 @@
+from machine_player import *
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import copy
+import os
+
+ALGORITHMS = {
+    "random": UniformRandomAlgorithm,
+    "dlru": DownLeftRightUpAlgorithm,
+    "astar": AStartAlgorithm,
+    "td": TDTreeSearchAlgorithm,
+    "expectimax": ExpectimaxAlgorithm,
+    "montecarlo": MonteCarloAlgorithm,
+}
+
+
+# ------------------------------- Workers -------------------------------
+def play_game(algorithm, seed):
+    # plays one game and returns only its summary, the history is never built. The game spawns from
+    # its own seeded rng; the global seeds are for algorithms that draw from random or np.random
+    random.seed(seed)
+    np.random.seed(seed % 2 ** 32)
+    game = Game(seed=seed)
+    start_time = time.time()
+    while not game.is_over():
+        game.move(algorithm(game.matrix))
+    return {
+        "seed": seed,
+        "score": game.true_score,
+        "max_tile": game.largest_number(),
+        "moves": game.total_moves,
+        "invalid_moves": game.invalid_moves,
+        "play_time": time.time() - start_time,
+    }
+
+
+def play_chunk(algorithm, seeds):
+    # every game gets a fresh copy so stateful algorithms don't leak between games
+    return [play_game(copy.deepcopy(algorithm), seed) for seed in seeds]
+
+
+# ------------------------------- Tournament -------------------------------
+def iter_tournament(algorithm, games, workers=None, chunk_size=None, seed=0):
+    workers = workers or os.cpu_count()
+    if chunk_size is None:
+        chunk_size = max(1, games // (workers * 4))
+    seeds = [seed * 1000003 + i for i in range(games)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(play_chunk, algorithm, seeds[i:i + chunk_size]) for i in range(0, games, chunk_size)]
+        for future in as_completed(futures):
+            for result in future.result():
+                yield result
+
+
+def summarize(results, elapsed):
+    scores = np.array([r["score"] for r in results])
+    total_moves = sum(r["moves"] for r in results)
+    max_tiles = {}
+    for r in results:
+        max_tiles[r["max_tile"]] = max_tiles.get(r["max_tile"], 0) + 1
+    return {
+        "games": len(results),
+        "elapsed": elapsed,
+        "games_per_sec": len(results) / elapsed,
+        "moves_per_sec": total_moves / elapsed,
+        "invalid_move_ratio": sum(r["invalid_moves"] for r in results) / max(total_moves, 1),
+        "score_mean": float(scores.mean()),
+        "score_std": float(scores.std()),
+        "score_min": int(scores.min()),
+        "score_p25": float(np.percentile(scores, 25)),
+        "score_median": float(np.median(scores)),
+        "score_p75": float(np.percentile(scores, 75)),
+        "score_max": int(scores.max()),
+        "max_tiles": dict(sorted(max_tiles.items())),
+    }
+
+
+def print_summary(summary):
+    print("Games: {games} in {elapsed:.2f}s ({games_per_sec:.2f} games/sec, {moves_per_sec:.0f} moves/sec)".format(**summary))
+    print("Score: mean {score_mean:.1f} std {score_std:.1f} min {score_min} p25 {score_p25:.0f} "
+          "median {score_median:.0f} p75 {score_p75:.0f} max {score_max}".format(**summary))
+    print("Invalid move ratio: {invalid_move_ratio:.4f}".format(**summary))
+    for tile, count in summary["max_tiles"].items():
+        print("  max tile {:>6}: {:>6} ({:.1%})".format(tile, count, count / summary["games"]))
+
+
+def run_tournament(algorithm, games, workers=None, chunk_size=None, seed=0, verbose=False):
+    start_time = time.time()
+    results = []
+    for result in iter_tournament(algorithm, games, workers, chunk_size, seed):
+        results.append(result)
+        if verbose:
+            print("Game {} finished with {} moves and score {} and play time {:.3f}".format(
+                len(results), result["moves"], result["score"], result["play_time"]))
+    summary = summarize(results, time.time() - start_time)
+    print_summary(summary)
+    return results, summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play many games of one algorithm across a process pool")
+    parser.add_argument("algorithm", choices=sorted(ALGORITHMS))
+    parser.add_argument("-n", "--games", type=int, default=100)
+    parser.add_argument("-w", "--workers", type=int, default=None)
+    parser.add_argument("-c", "--chunk-size", type=int, default=None)
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+    run_tournament(ALGORITHMS[args.algorithm](), args.games, args.workers, args.chunk_size, args.seed, args.verbose)